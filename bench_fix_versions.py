@@ -0,0 +1,89 @@
+# release_notes_generator/bench_fix_versions.py
+"""Замер стоимости разбора ячеек 'Fix Version/s' на строку: без кэша и с кэшем parse_fix_version_cells.
+
+Генерирует синтетическую выгрузку, похожую на реальный релиз: тысячи задач делят
+несколько десятков комбинаций версий вида "FR2.3.6, IN1.4, R5 (global)".
+Запуск: python bench_fix_versions.py [--rows 100000] [--combinations 40] [--repeat 3]
+"""
+import argparse
+import random
+import time
+
+import csv_importer
+
+SERVICE_PREFIXES = ("FR", "IN", "IP", "PR", "PP", "SC", "AM", "KF", "IR", "WF", "NT", "CA")
+
+
+def generate_fix_version_rows(rows_count, combinations_count, seed=42):
+    """Строки с двумя колонками 'Fix Version/s'; комбинации версий повторяются с распределением, близким к реальному."""
+    rng = random.Random(seed)
+    combinations = []
+    for _ in range(combinations_count):
+        versions = [f"{prefix}{rng.randint(1, 5)}.{rng.randint(0, 9)}.{rng.randint(0, 20)}"
+                    for prefix in rng.sample(SERVICE_PREFIXES, rng.randint(1, 4))]
+        if rng.random() < 0.7:
+            versions.append("R5 (global)")
+        split_at = rng.randint(0, len(versions))
+        combinations.append((", ".join(versions[:split_at]), ", ".join(versions[split_at:])))
+    # Несколько комбинаций покрывают большую часть задач, остальные встречаются редко
+    weights = [1 / (rank + 1) for rank in range(combinations_count)]
+    return [list(cells) for cells in rng.choices(combinations, weights=weights, k=rows_count)]
+
+
+def parse_row_uncached(row, fix_versions_col_indices):
+    """Прежний разбор строки: split/strip/set/regex для каждой строки заново."""
+    task_versions_from_row = []
+    global_titles = []
+    for index in fix_versions_col_indices:
+        if index < len(row) and row[index]:
+            task_versions_from_row.extend([v.strip() for v in row[index].split(',') if v.strip()])
+            for version in row[index].split(','):
+                if "(global)" in version:
+                    title = version.replace("(global)", "").strip()
+                    if title: global_titles.append(title)
+    microservice_versions = sorted(ver for ver in set(task_versions_from_row)
+                                   if csv_importer.MICROSERVICE_VERSION_PATTERN.match(ver))
+    return microservice_versions, global_titles
+
+
+def parse_row_cached(row, fix_versions_col_indices):
+    return csv_importer.parse_fix_version_cells(csv_importer.fix_version_cells(row, fix_versions_col_indices))
+
+
+def time_per_row(parse_row, rows, fix_versions_col_indices, repeat):
+    best_seconds = None
+    for _ in range(repeat):
+        csv_importer.parse_fix_version_cells.cache_clear()
+        started = time.perf_counter()
+        for row in rows:
+            parse_row(row, fix_versions_col_indices)
+        elapsed = time.perf_counter() - started
+        best_seconds = elapsed if best_seconds is None else min(best_seconds, elapsed)
+    return best_seconds / len(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк кэша разбора версий 'Fix Version/s'.")
+    parser.add_argument("--rows", type=int, default=100000, help="Число строк синтетической выгрузки")
+    parser.add_argument("--combinations", type=int, default=40, help="Число различных комбинаций версий")
+    parser.add_argument("--repeat", type=int, default=3, help="Число повторов, берется лучший")
+    args = parser.parse_args()
+
+    rows = generate_fix_version_rows(args.rows, args.combinations)
+    fix_versions_col_indices = [0, 1]
+    for row in rows:
+        uncached = parse_row_uncached(row, fix_versions_col_indices)
+        cached = parse_row_cached(row, fix_versions_col_indices)
+        assert (tuple(uncached[0]), tuple(uncached[1])) == cached, f"Результаты разбора расходятся для {row}"
+
+    uncached_seconds = time_per_row(parse_row_uncached, rows, fix_versions_col_indices, args.repeat)
+    cached_seconds = time_per_row(parse_row_cached, rows, fix_versions_col_indices, args.repeat)
+    cache_info = csv_importer.parse_fix_version_cells.cache_info()
+    print(f"Строк: {len(rows)}, различных комбинаций ячеек: {cache_info.currsize}")
+    print(f"Без кэша: {uncached_seconds * 1e6:.2f} мкс/строка")
+    print(f"С кэшем:  {cached_seconds * 1e6:.2f} мкс/строка (ускорение x{uncached_seconds / cached_seconds:.1f}, "
+          f"попаданий {cache_info.hits / (cache_info.hits + cache_info.misses) * 100:.1f}%)")
+
+
+if __name__ == "__main__":
+    main()
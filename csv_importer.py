@@ -2,10 +2,17 @@
 import csv
 import logging
 import re
-from collections import defaultdict
+from collections import Counter, defaultdict
+from functools import lru_cache
+from itertools import groupby, product
+from operator import itemgetter
 
 logger = logging.getLogger(__name__)
 
+MICROSERVICE_VERSION_PATTERN = re.compile(r"^([A-Z]{2})(\d+(\.\d+){1,2})$")
+# Число различных комбинаций ячеек 'Fix Version/s' в кэше разбора; в выгрузке релиза их обычно десятки
+FIX_VERSION_CACHE_SIZE = 4096
+
 
 def sanitize_text_csv(text):
     if text is None: return ""
@@ -18,134 +25,348 @@ def extract_client_name(client_contract_string):
     return client_contract_string.split('#')[0].strip()
 
 
-def load_and_process_issues(csv_filepath, col_config):
-    all_rows = []
-    header = []
+def resolve_columns(header, col_config):
+    """Проверяет заголовок CSV и находит индексы нужных колонок.
+
+    Возвращает (header_map, fix_versions_col_indices, issue_type_col_index, client_contract_col_index,
+    group_col_indices) или None, если обязательные колонки не найдены.
+    group_col_indices - индексы всех колонок каждого дополнительного уровня группировки (component, ...).
+    """
     header_map = {}
     client_contract_col_index = None  # Инициализируем здесь
 
+    logger.debug(f"CSV Headers: {header}")
+    for i, col_name in enumerate(header):
+        clean_col_name = sanitize_text_csv(col_name)
+        if clean_col_name not in header_map:
+            header_map[clean_col_name] = i
+
+    required_cols_present = True
+    cols_to_check_existence = {  # Колонки, чье существование важно
+        'key': col_config['key'],
+        'customer_desc': col_config['customer_desc'],
+        'install_instructions': col_config['install_instructions'],
+        'fix_versions': col_config['fix_versions_name']  # Имя колонки, а не значение из col_config
+    }
+    if col_config.get('use_issue_type_grouping', False):
+        cols_to_check_existence['issue_type'] = col_config['issue_type']
+    # Без колонки клиента фильтр --client не применить, а вывод без фильтра отдал бы задачи чужих клиентов
+    if col_config.get('use_client_grouping', False) or col_config.get('only_clients'):
+        if 'client_contract' not in col_config or not col_config['client_contract']:
+            logger.error("Группировка или фильтр по клиенту включены, но 'client_contract' не задан в [Columns] конфига.")
+            required_cols_present = False
+        else:
+            cols_to_check_existence['client_contract'] = col_config['client_contract']
+
+    for col_key_internal, col_name_in_csv in cols_to_check_existence.items():
+        # Для fix_versions ищем имя в header, для остальных - в header_map
+        if col_key_internal == 'fix_versions':
+            if col_name_in_csv not in header:
+                logger.error(
+                    f"Ошибка: Колонка '{col_name_in_csv}' (для поля '{col_key_internal}') не найдена в CSV заголовках.")
+                required_cols_present = False
+        elif col_name_in_csv not in header_map:
+            logger.error(
+                f"Ошибка: Колонка '{col_name_in_csv}' (для поля '{col_key_internal}') не найдена в CSV файле.")
+            required_cols_present = False
+
+    issue_type_col_index = None
+    # Колонки типа и клиента нужны и для таблиц статистики, даже если по ним нет группировки
+    if col_config.get('use_issue_type_grouping', False) or col_config.get('include_statistics', False):
+        issue_type_col_name = col_config.get('issue_type')
+        if issue_type_col_name in header_map:
+            issue_type_col_index = header_map[issue_type_col_name]
+        else:  # Уже должно быть поймано выше, но для безопасности
+            logger.warning(
+                f"Колонка типа задачи '{issue_type_col_name}' не найдена. Группировка по типу будет отключена.")
+            col_config['use_issue_type_grouping'] = False
+
+    # Колонка клиента нужна также для разбиения по клиентам и фильтра --client
+    if col_config.get('use_client_grouping', False) or col_config.get('include_statistics', False) or \
+            col_config.get('split_by_client', False) or col_config.get('only_clients'):
+        client_contract_col_name = col_config.get('client_contract')
+        if client_contract_col_name in header_map:
+            client_contract_col_index = header_map[client_contract_col_name]
+        else:
+            logger.error(
+                f"Колонка клиента '{client_contract_col_name}' не найдена. Группировка по клиенту невозможна.")
+            col_config['use_client_grouping'] = False  # Отключаем, если колонка не найдена
+            # required_cols_present = False # Можно и так, если это критично
+
+    if not required_cols_present:
+        return None
+
+    fix_versions_col_indices = [i for i, h_col in enumerate(header) if
+                                sanitize_text_csv(h_col) == col_config['fix_versions_name']]
+    if not fix_versions_col_indices:
+        logger.error(f"Крит. ошибка: Колонка '{col_config['fix_versions_name']}' не найдена.")
+        return None
+
+    # Многозначные поля Jira (Component/s, Labels) выгружаются повторяющимися колонками, как и Fix Version/s,
+    # поэтому для дополнительных уровней группировки собираются все колонки с этим именем
+    group_col_indices = {}
+    for level_name in col_config.get('grouping_levels', []):
+        if level_name in ('client', 'issue_type'): continue
+        col_name = col_config.get('group_columns', {}).get(level_name, level_name)
+        group_col_indices[level_name] = [i for i, h_col in enumerate(header) if sanitize_text_csv(h_col) == col_name]
+
+    return header_map, fix_versions_col_indices, issue_type_col_index, client_contract_col_index, group_col_indices
+
+
+def make_row_filter(col_config, fix_versions_col_indices, client_contract_col_index):
+    """Ранний фильтр строк по сырым ячейкам (до очистки и разбора версий).
+
+    col_config['only_services'] - префиксы микросервисов (FR, IN) или полные версии (FR2.3.6),
+    col_config['only_clients'] - имена клиентов. Возвращает функцию row -> bool или None, если фильтров нет.
+    """
+    only_services = col_config.get('only_services') or []
+    only_clients = {client.casefold() for client in col_config.get('only_clients') or []}
+    if not only_services and not only_clients:
+        return None
+    if only_clients and client_contract_col_index is None:
+        # resolve_columns не пропускает такой случай; молча выводить задачи всех клиентов нельзя
+        raise ValueError("Фильтр по клиенту задан, но колонка клиента не найдена.")
+
+    # Совпадение версии в любом месте списка "FR2.3.6, IN1.4": после начала ячейки или запятой
+    # Префикс (FR) должен продолжаться цифрами версии, полная версия (FR2.3.6) - заканчиваться запятой или концом
+    services_alternatives = [re.escape(service) + (r"\d" if len(service) == 2 else r"\s*(?:,|$)")
+                             for service in only_services]
+    services_pattern = re.compile(r"(?:^|,)\s*(?:" + "|".join(services_alternatives) + ")") \
+        if only_services else None
+
+    def row_filter(row):
+        if services_pattern is not None and not any(
+                index < len(row) and services_pattern.search(row[index]) for index in fix_versions_col_indices):
+            return False
+        if only_clients:
+            raw_client = row[client_contract_col_index] if client_contract_col_index < len(row) else ""
+            if extract_client_name(raw_client.strip()).casefold() not in only_clients:
+                return False
+        return True
+
+    return row_filter
+
+
+def sanitize_rows(rows, header_len, first_row_index=0, row_filter=None):
+    """Очищает ячейки строк данных; строки с неверным числом колонок пропускаются.
+
+    Строки, отклоненные row_filter, отбрасываются до очистки ячеек.
+    """
+    sanitized_rows = []
+    for i, row in enumerate(rows, start=first_row_index):
+        if len(row) == header_len:
+            if row_filter is not None and not row_filter(row):
+                continue
+            sanitized_rows.append([sanitize_text_csv(cell) for cell in row])
+        elif any(cell.strip() for cell in row):
+            logger.warning(f"Строка {i + 2}: Пропуск...")
+    return sanitized_rows
+
+
+def load_and_process_issues(csv_filepath, col_config):
     try:
         with open(csv_filepath, mode='r', encoding='utf-8-sig') as csvfile:
             reader = csv.reader(csvfile, delimiter=',')
             header = next(reader)
-            logger.debug(f"CSV Headers: {header}")
-            for i, col_name in enumerate(header):
-                clean_col_name = sanitize_text_csv(col_name)
-                if clean_col_name not in header_map:
-                    header_map[clean_col_name] = i
-
-            required_cols_present = True
-            cols_to_check_existence = {  # Колонки, чье существование важно
-                'key': col_config['key'],
-                'customer_desc': col_config['customer_desc'],
-                'install_instructions': col_config['install_instructions'],
-                'fix_versions': col_config['fix_versions_name']  # Имя колонки, а не значение из col_config
-            }
-            if col_config.get('use_issue_type_grouping', False):
-                cols_to_check_existence['issue_type'] = col_config['issue_type']
-            if col_config.get('use_client_grouping', False):
-                if 'client_contract' not in col_config or not col_config['client_contract']:
-                    logger.error("Группировка по клиенту включена, но 'client_contract' не задан в [Columns] конфига.")
-                    required_cols_present = False
-                else:
-                    cols_to_check_existence['client_contract'] = col_config['client_contract']
-
-            for col_key_internal, col_name_in_csv in cols_to_check_existence.items():
-                # Для fix_versions ищем имя в header, для остальных - в header_map
-                if col_key_internal == 'fix_versions':
-                    if col_name_in_csv not in header:
-                        logger.error(
-                            f"Ошибка: Колонка '{col_name_in_csv}' (для поля '{col_key_internal}') не найдена в CSV заголовках.")
-                        required_cols_present = False
-                elif col_name_in_csv not in header_map:
-                    logger.error(
-                        f"Ошибка: Колонка '{col_name_in_csv}' (для поля '{col_key_internal}') не найдена в CSV файле.")
-                    required_cols_present = False
-
-            issue_type_col_index = None
-            if col_config.get('use_issue_type_grouping', False):
-                issue_type_col_name = col_config.get('issue_type')
-                if issue_type_col_name in header_map:
-                    issue_type_col_index = header_map[issue_type_col_name]
-                else:  # Уже должно быть поймано выше, но для безопасности
-                    logger.warning(
-                        f"Колонка типа задачи '{issue_type_col_name}' не найдена. Группировка по типу будет отключена.")
-                    col_config['use_issue_type_grouping'] = False
-
-            if col_config.get('use_client_grouping', False):
-                client_contract_col_name = col_config.get('client_contract')
-                if client_contract_col_name in header_map:
-                    client_contract_col_index = header_map[client_contract_col_name]
-                else:
-                    logger.error(
-                        f"Колонка клиента '{client_contract_col_name}' не найдена. Группировка по клиенту невозможна.")
-                    col_config['use_client_grouping'] = False  # Отключаем, если колонка не найдена
-                    # required_cols_present = False # Можно и так, если это критично
-
-            if not required_cols_present:
-                return None, None, None, None, None
-
-            fix_versions_col_indices = [i for i, h_col in enumerate(header) if
-                                        sanitize_text_csv(h_col) == col_config['fix_versions_name']]
-            if not fix_versions_col_indices:
-                logger.error(f"Крит. ошибка: Колонка '{col_config['fix_versions_name']}' не найдена.")
-                return None, None, None, None, None
-
-            for i, row in enumerate(reader):
-                if len(row) == len(header):
-                    all_rows.append([sanitize_text_csv(cell) for cell in row])
-                elif any(cell.strip() for cell in row):
-                    logger.warning(f"Строка {i + 2}: Пропуск...")
+            resolved_columns = resolve_columns(header, col_config)
+            if resolved_columns is None:
+                return None, None, None, None, None, None
+            header_map, fix_versions_col_indices, issue_type_col_index, client_contract_col_index, \
+                group_col_indices = resolved_columns
+
+            row_filter = make_row_filter(col_config, fix_versions_col_indices, client_contract_col_index)
+            all_rows = sanitize_rows(reader, len(header), row_filter=row_filter)
 
         logger.info(f"load_and_process_issues: Успешно прочитано {len(all_rows)} строк данных.")
-        return all_rows, header_map, fix_versions_col_indices, issue_type_col_index, client_contract_col_index
+        return all_rows, header_map, fix_versions_col_indices, issue_type_col_index, client_contract_col_index, \
+            group_col_indices
 
     except FileNotFoundError:
         logger.error(f"Ошибка: CSV файл '{csv_filepath}' не найден.")
-        return None, None, None, None, None
+        return None, None, None, None, None, None
     except StopIteration:
         logger.error(f"Ошибка: CSV файл '{csv_filepath}' пуст или содержит только строку заголовков.")
-        return None, None, None, None, None
+        return None, None, None, None, None, None
     except Exception as e:
         logger.error(f"Ошибка при чтении CSV файла '{csv_filepath}': {e}", exc_info=True)
-        return None, None, None, None, None
+        return None, None, None, None, None, None
 
 
-def group_issues(all_tasks_data, header_map, col_config,
-                 fix_versions_col_indices, issue_type_col_index, client_contract_col_index,
-                 main_config_data):
-    use_client_grouping = col_config.get('use_client_grouping', False) and client_contract_col_index is not None
-    use_type_grouping = col_config.get('use_issue_type_grouping', False) and issue_type_col_index is not None
-
-    logger.info(f"Настройки группировки: по клиенту={use_client_grouping}, по типу задачи={use_type_grouping}")
-
-    # Динамическое создание вложенности defaultdict
-    if use_client_grouping and use_type_grouping:
-        grouped_issues = defaultdict(lambda: defaultdict(lambda: defaultdict(list)))  # ms -> client -> type -> tasks
-    elif use_client_grouping:
-        grouped_issues = defaultdict(lambda: defaultdict(list))  # ms -> client -> tasks
-    elif use_type_grouping:
-        grouped_issues = defaultdict(lambda: defaultdict(list))  # ms -> type -> tasks
-    else:
-        grouped_issues = defaultdict(list)  # ms -> tasks
-
-    microservice_version_pattern = re.compile(r"^([A-Z]{2})(\d+(\.\d+){1,2})$")
-    key_col_idx = header_map.get(col_config['key'])
-    cust_desc_col_idx = header_map.get(col_config['customer_desc'])
-    install_instr_col_idx = header_map.get(col_config['install_instructions'])
+# Значения групп "по умолчанию" (пустая ячейка)
+FALLBACK_GROUP_NAMES = {'client': "Не указан", 'issue_type': "Не указан тип"}
+DEFAULT_FALLBACK_GROUP_NAME = "Не указано"
+# Группы, которые выводятся после остальных (в нижнем регистре)
+TRAILING_GROUP_NAMES = {'client': {"не указан", "общие задачи"}, 'issue_type': {"не указан тип", "задачи"}}
+
+
+def _make_level_value_getter(level_name, col_index, main_config_data):
+    """Возвращает функцию row -> имя группы для уровня группировки."""
+    fallback_name = FALLBACK_GROUP_NAMES.get(level_name, DEFAULT_FALLBACK_GROUP_NAME)
+    issue_type_names = main_config_data.get('IssueTypeNames', {})
+
+    def get_value(row):
+        raw_value = row[col_index].strip() if col_index < len(row) and row[col_index] else ""
+        if level_name == 'client':
+            return (extract_client_name(raw_value) if raw_value else "") or fallback_name
+        if not raw_value:
+            return fallback_name
+        if level_name == 'issue_type':
+            return issue_type_names.get(raw_value, raw_value)
+        return raw_value
+
+    return get_value
+
+
+def _make_level_values_getter(level_name, col_indices):
+    """Функция row -> кортеж имен групп для многозначного уровня (повторяющиеся колонки, как Component/s).
+
+    Задача попадает в группу каждого различного непустого значения; без значений - в группу по умолчанию.
+    """
+    fallback_names = (FALLBACK_GROUP_NAMES.get(level_name, DEFAULT_FALLBACK_GROUP_NAME),)
+
+    def get_values(row):
+        values = dict.fromkeys(row[index].strip() for index in col_indices if index < len(row) and row[index].strip())
+        return tuple(values) or fallback_names
+
+    return get_values
+
+
+def resolve_grouping_levels(col_config, group_col_indices, issue_type_col_index, client_contract_col_index,
+                            main_config_data):
+    """Сопоставляет уровни группировки из col_config['grouping_levels'] с колонками CSV.
 
+    Уровни 'client' и 'issue_type' используют колонки, найденные в load_and_process_issues,
+    остальные (component, priority, epic, ...) - все колонки с именем из col_config['group_columns']
+    (group_col_indices из resolve_columns).
+    Возвращает список (имя уровня, функция row -> кортеж имен групп, имена групп, выводимые последними).
+    """
+    levels = []
+    for level_name in col_config.get('grouping_levels', []):
+        if level_name in ('client', 'issue_type'):
+            col_index = client_contract_col_index if level_name == 'client' else issue_type_col_index
+            get_value = _make_level_value_getter(level_name, col_index, main_config_data) \
+                if col_index is not None else None
+            get_values = (lambda row, get_value=get_value: (get_value(row),)) if get_value else None
+        else:
+            col_indices = group_col_indices.get(level_name)
+            get_values = _make_level_values_getter(level_name, col_indices) if col_indices else None
+        if get_values is None:
+            logger.warning(f"Колонка для уровня группировки '{level_name}' не найдена. Уровень пропущен.")
+            continue
+        trailing_names = TRAILING_GROUP_NAMES.get(level_name, {DEFAULT_FALLBACK_GROUP_NAME.lower()})
+        levels.append((level_name, get_values, trailing_names))
+    return levels
+
+
+def _nest_sorted_entries(entries, depth, levels_count):
+    """Строит поддерево версии из отсортированных пар (путь групп, задача) одним проходом groupby на уровень."""
+    if depth > levels_count:
+        return [task for _, task in entries]
+    return {group_name: _nest_sorted_entries(list(group_entries), depth + 1, levels_count)
+            for group_name, group_entries in groupby(entries, key=lambda entry: entry[0][depth - 1])}
+
+
+def new_grouping_state(header_map, col_config, issue_type_col_index, client_contract_col_index,
+                       main_config_data, collect_statistics=False, group_col_indices=None):
+    """Готовит состояние группировки, в которое строки можно добавлять порциями (add_rows_to_grouping).
+
+    В 'level_names' - фактические уровни группировки (только с найденными колонками).
+    Возвращает None, если не найдена колонка ключа задачи.
+    """
+    levels = resolve_grouping_levels(col_config, group_col_indices or {}, issue_type_col_index,
+                                     client_contract_col_index, main_config_data)
+    logger.info(f"Уровни группировки: версия микросервиса -> {' -> '.join(name for name, _, _ in levels) or 'задачи'}")
+
+    key_col_idx = header_map.get(col_config['key'])
     if key_col_idx is None: return None
 
-    for row_num, raw_row_data in enumerate(all_tasks_data):
+    # Клиент сохраняется в задаче, чтобы результат можно было разбить по клиентам
+    client_getter = _make_level_value_getter('client', client_contract_col_index, main_config_data) \
+        if client_contract_col_index is not None else None
+    only_services = tuple(col_config.get('only_services') or ())
+    statistics_getters = None
+    if collect_statistics:
+        statistics_getters = [_make_level_value_getter(level_name, col_index, main_config_data)
+                              if col_index is not None else None
+                              for level_name, col_index in (('issue_type', issue_type_col_index),
+                                                            ('client', client_contract_col_index))]
+    return {'levels': levels,
+            'level_names': tuple(name for name, _, _ in levels),
+            'key_col_idx': key_col_idx,
+            'cust_desc_col_idx': header_map.get(col_config['customer_desc']),
+            'install_instr_col_idx': header_map.get(col_config['install_instructions']),
+            'client_getter': client_getter,
+            'only_services': only_services,
+            'statistics_getters': statistics_getters,
+            'statistics_counts': defaultdict(Counter),
+            'entries': [],
+            'global_versions': set(),
+            'rows_seen': 0}
+
+
+def fix_version_cells(row, fix_versions_col_indices):
+    """Кортеж сырых ячеек 'Fix Version/s' строки - ключ кэша разбора версий."""
+    return tuple(row[index] if index < len(row) else "" for index in fix_versions_col_indices)
+
+
+@lru_cache(maxsize=FIX_VERSION_CACHE_SIZE)
+def parse_fix_version_cells(cells):
+    """Разбирает ячейки 'Fix Version/s' одной строки: (версии микросервисов по порядку, глобальные версии).
+
+    Одни и те же комбинации версий повторяются в тысячах задач релиза, поэтому результат
+    кэшируется по кортежу сырых ячеек и каждая комбинация разбирается один раз.
+    """
+    versions = set()
+    global_titles = []
+    for cell in cells:
+        if not cell: continue
+        for version in cell.split(','):
+            if "(global)" in version:
+                title = version.replace("(global)", "").strip()
+                if title: global_titles.append(title)
+            version = version.strip()
+            if version: versions.add(version)
+    return tuple(sorted(ver for ver in versions if MICROSERVICE_VERSION_PATTERN.match(ver))), tuple(global_titles)
+
+
+def log_fix_version_cache_stats():
+    cache_info = parse_fix_version_cells.cache_info()
+    lookups = cache_info.hits + cache_info.misses
+    hit_rate = cache_info.hits / lookups * 100 if lookups else 0.0
+    logger.info(f"Кэш разбора версий: обращений {lookups}, попаданий {cache_info.hits} ({hit_rate:.1f}%), "
+                f"уникальных комбинаций {cache_info.currsize} из {cache_info.maxsize}")
+
+
+def _matches_services(ms_version_key, only_services):
+    return ms_version_key in only_services or ms_version_key[:2] in only_services
+
+
+def add_rows_to_grouping(grouping_state, rows, fix_versions_col_indices):
+    """Разбирает порцию строк: для каждой пары (версия микросервиса, задача) запоминает составной ключ сортировки.
+
+    Попутно собирает глобальные версии (суффикс '(global)') для заголовка релиза.
+    """
+    levels = grouping_state['levels']
+    key_col_idx = grouping_state['key_col_idx']
+    cust_desc_col_idx = grouping_state['cust_desc_col_idx']
+    install_instr_col_idx = grouping_state['install_instr_col_idx']
+    client_getter = grouping_state['client_getter']
+    only_services = grouping_state['only_services']
+    statistics_getters = grouping_state['statistics_getters']
+    statistics_counts = grouping_state['statistics_counts']
+    entries = grouping_state['entries']
+    global_versions = grouping_state['global_versions']
+
+    for row_num, raw_row_data in enumerate(rows, start=grouping_state['rows_seen']):
         task_key_value = raw_row_data[key_col_idx] if key_col_idx < len(raw_row_data) else f"ROW_{row_num + 1}_NO_KEY"
 
-        task_versions_from_row = []
-        for index in fix_versions_col_indices:
-            if index < len(raw_row_data) and raw_row_data[index]:
-                task_versions_from_row.extend([v.strip() for v in raw_row_data[index].split(',') if v.strip()])
-        task_versions_unique = list(set(task_versions_from_row))
-        current_microservice_versions_original = [ver for ver in task_versions_unique if
-                                                  microservice_version_pattern.match(ver)]
+        # Глобальные версии для заголовка собираются в том же проходе, каждая строка разбирается один раз
+        current_microservice_versions_original, row_global_versions = parse_fix_version_cells(
+            fix_version_cells(raw_row_data, fix_versions_col_indices))
+        global_versions.update(row_global_versions)
+        if only_services:
+            current_microservice_versions_original = [ver for ver in current_microservice_versions_original
+                                                      if _matches_services(ver, only_services)]
         if not current_microservice_versions_original: continue
 
         task_details = {
@@ -156,66 +377,79 @@ def group_issues(all_tasks_data, header_map, col_config,
                 install_instr_col_idx] if install_instr_col_idx is not None and install_instr_col_idx < len(
                 raw_row_data) and raw_row_data[install_instr_col_idx] else ""
         }
+        if client_getter is not None:
+            task_details['client'] = client_getter(raw_row_data)
+
+        # Для многозначных уровней задача выводится в каждой комбинации групп
+        group_paths = list(product(*(get_values(raw_row_data) for _, get_values, _ in levels)))
+        for group_path in group_paths:
+            # Составной ключ сортировки строится один раз на путь групп: группы "по умолчанию" в конце, затем по алфавиту
+            path_sort_key = tuple((group_name.lower() in trailing_names, group_name.lower(), group_name)
+                                  for group_name, (_, _, trailing_names) in zip(group_path, levels))
+            for ms_ver_key in current_microservice_versions_original:
+                entries.append(((ms_ver_key, path_sort_key, task_key_value), group_path, task_details))
+        if statistics_getters:
+            statistics_key = tuple(get_value(raw_row_data) if get_value else "—" for get_value in statistics_getters)
+            for ms_ver_key in current_microservice_versions_original:
+                statistics_counts[ms_ver_key][statistics_key] += 1
+    grouping_state['rows_seen'] += len(rows)
+
+
+def iter_grouped_versions(grouping_state):
+    """Сортирует накопленные записи одним sort и по очереди отдает готовые версии.
+
+    Для каждой версии выдает (ключ версии, поддерево групп, строки статистики или None);
+    версия готова, как только groupby перешел к следующей, поэтому ее можно выводить сразу.
+    """
+    entries = grouping_state['entries']
+    entries.sort(key=itemgetter(0))
+    levels_count = len(grouping_state['levels'])
+    for ms_ver_key, version_entries in groupby(entries, key=lambda entry: entry[0][0]):
+        subtree = _nest_sorted_entries([(group_path, task) for _, group_path, task in version_entries],
+                                       1, levels_count)
+        statistics_rows = None
+        if grouping_state['statistics_getters'] is not None:
+            statistics_rows = [{'issue_type': issue_type, 'client': client, 'count': count} for (issue_type, client), count
+                               in sorted(grouping_state['statistics_counts'][ms_ver_key].items())]
+        yield ms_ver_key, subtree, statistics_rows
+
+
+def get_grouped_version_keys(grouping_state):
+    """Отсортированные ключи всех версий микросервисов, известные после разбора всех строк."""
+    return sorted({sort_key[0] for sort_key, _, _ in grouping_state['entries']})
 
-        client_name_for_group = "Общие задачи"  # Используется если use_client_grouping = False
-        if use_client_grouping:
-            raw_client_string = raw_row_data[client_contract_col_index] if client_contract_col_index < len(
-                raw_row_data) else ""
-            client_name_for_group = extract_client_name(raw_client_string)
-            logger.debug(
-                f"Задача {task_key_value}: клиент '{client_name_for_group}' (из строки: '{raw_client_string[:50]}...')")
-
-        issue_type_display_for_group = "Задачи"  # Используется если use_type_grouping = False
-        if use_type_grouping:
-            system_issue_type = raw_row_data[issue_type_col_index] if issue_type_col_index < len(
-                raw_row_data) else "Не указан тип"
-            system_issue_type = system_issue_type.strip() if system_issue_type else "Не указан тип"
-            issue_type_display_for_group = main_config_data.get('IssueTypeNames', {}).get(system_issue_type,
-                                                                                          system_issue_type)
-            logger.debug(
-                f"Задача {task_key_value}: тип '{issue_type_display_for_group}' (системный: '{system_issue_type}')")
-
-        for ms_ver_key in current_microservice_versions_original:
-            if use_client_grouping and use_type_grouping:
-                grouped_issues[ms_ver_key][client_name_for_group][issue_type_display_for_group].append(task_details)
-            elif use_client_grouping:
-                grouped_issues[ms_ver_key][client_name_for_group].append(task_details)
-            elif use_type_grouping:
-                grouped_issues[ms_ver_key][issue_type_display_for_group].append(task_details)
-            else:
-                grouped_issues[ms_ver_key].append(task_details)
-
-    # Сортировка
-    for ms_ver_key in grouped_issues:
-        if use_client_grouping and use_type_grouping:
-            for client_key in grouped_issues[ms_ver_key]:
-                for type_key in grouped_issues[ms_ver_key][client_key]:
-                    grouped_issues[ms_ver_key][client_key][type_key].sort(key=lambda x: x['key'])
-        elif use_client_grouping:
-            for client_key in grouped_issues[ms_ver_key]:
-                grouped_issues[ms_ver_key][client_key].sort(key=lambda x: x['key'])
-        elif use_type_grouping:
-            for type_key in grouped_issues[ms_ver_key]:
-                grouped_issues[ms_ver_key][type_key].sort(key=lambda x: x['key'])
-        else:
-            grouped_issues[ms_ver_key].sort(key=lambda x: x['key'])
+
+def group_issues(all_tasks_data, header_map, col_config,
+                 fix_versions_col_indices, issue_type_col_index, client_contract_col_index,
+                 main_config_data, statistics=None, group_col_indices=None):
+    """Группирует задачи: версия микросервиса -> уровни из col_config['grouping_levels'] -> задачи.
+
+    Возвращает (сгруппированные задачи, фактические уровни группировки, часть заголовка из глобальной версии)
+    либо (None, None, None).
+    Задачи - вложенные dict с ключами в порядке вывода и списками задач на последнем уровне,
+    одинаковые по форме для любого числа уровней. Для многозначных уровней (повторяющиеся колонки,
+    как Component/s) задача выводится в группе каждого своего значения.
+    Если передан словарь statistics, в том же проходе он заполняется готовыми строками
+    таблиц статистики: версия -> [{'issue_type', 'client', 'count'}, ...].
+    """
+    grouping_state = new_grouping_state(header_map, col_config, issue_type_col_index, client_contract_col_index,
+                                        main_config_data, collect_statistics=statistics is not None,
+                                        group_col_indices=group_col_indices)
+    if grouping_state is None: return None, None, None
+    add_rows_to_grouping(grouping_state, all_tasks_data, fix_versions_col_indices)
+
+    grouped_issues = {}
+    for ms_ver_key, subtree, statistics_rows in iter_grouped_versions(grouping_state):
+        grouped_issues[ms_ver_key] = subtree
+        if statistics is not None:
+            statistics[ms_ver_key] = statistics_rows
 
     logger.info(f"Группировка задач завершена.")
-    return grouped_issues
-
-
-def find_global_version_title(all_tasks_data, fix_versions_col_indices):
-    # ... (код этой функции без изменений) ...
-    global_versions_found = set()
-    for task_data_row in all_tasks_data:
-        current_task_versions = []
-        for index in fix_versions_col_indices:
-            if index < len(task_data_row) and task_data_row[index]:
-                current_task_versions.extend([v.strip() for v in task_data_row[index].split(',')])
-        for version in current_task_versions:
-            if "(global)" in version:
-                title = version.replace("(global)", "").strip()
-                if title: global_versions_found.add(title)
+    log_fix_version_cache_stats()
+    return grouped_issues, grouping_state['level_names'], get_global_version_title(grouping_state)
+
+
+def choose_global_version_title(global_versions_found):
     if not global_versions_found:
         logger.debug("Глобальная версия с суффиксом '(global)' не найдена.")
         return ""
@@ -224,4 +458,9 @@ def find_global_version_title(all_tasks_data, fix_versions_col_indices):
         logger.warning(f"Найдено несколько глобальных версий: {sorted_global_versions}. Используется первая.")
     final_title_part = sorted_global_versions[0]
     logger.info(f"Найдена часть глобальной версии для заголовка: '{final_title_part}'")
-    return final_title_part
\ No newline at end of file
+    return final_title_part
+
+
+def get_global_version_title(grouping_state):
+    """Часть заголовка релиза из глобальных версий, собранных add_rows_to_grouping."""
+    return choose_global_version_title(grouping_state['global_versions'])
@@ -1,14 +1,20 @@
 # release_notes_generator/docx_creator.py
+import io
+import itertools
 import logging
-from datetime import datetime
+from collections.abc import Mapping
+from datetime import datetime, timezone
 import os
 import re
+import zipfile
+from xml.sax.saxutils import escape as xml_escape
 
 try:
     from docx import Document
     from docx.shared import Pt, Inches, RGBColor
     from docx.enum.text import WD_ALIGN_PARAGRAPH, WD_LINE_SPACING
-    from docx.oxml.ns import qn
+    from docx.oxml import OxmlElement, parse_xml
+    from docx.oxml.ns import nsdecls, qn
 except ImportError:
     logging.critical("Библиотека python-docx не установлена. Установите ее командой: pip install python-docx")
     raise
@@ -133,6 +139,227 @@ def _add_formatted_paragraph(document, text, style_config,
     return p
 
 
+def task_bookmark_name(task_key):
+    # Имя закладки в Word: начинается с буквы, без пробелов и спецсимволов, не длиннее 40 символов
+    return ("task_" + re.sub(r"\W", "_", task_key))[:40]
+
+
+def _add_bookmark(paragraph, bookmark_name, bookmark_id):
+    """Оборачивает содержимое параграфа в закладку с заданным именем."""
+    bookmark_start = OxmlElement('w:bookmarkStart')
+    bookmark_start.set(qn('w:id'), str(bookmark_id))
+    bookmark_start.set(qn('w:name'), bookmark_name)
+    bookmark_end = OxmlElement('w:bookmarkEnd')
+    bookmark_end.set(qn('w:id'), str(bookmark_id))
+    if paragraph.runs:
+        paragraph.runs[0]._r.addprevious(bookmark_start)
+    else:
+        paragraph._p.append(bookmark_start)
+    paragraph._p.append(bookmark_end)
+
+
+def _add_internal_hyperlink(paragraph, text, anchor, style_config,
+                            font_key='main', fontsize_key='task_description', color_key='task_description'):
+    """Добавляет в параграф run-ссылку на закладку внутри документа."""
+    run = paragraph.add_run(sanitize_text_docx(text))
+    _apply_run_formatting(run,
+                          get_style_value(style_config, 'Fonts', font_key, 'Arial'),
+                          get_style_value(style_config, 'FontSizes', fontsize_key, 10, value_type=int),
+                          False, True,
+                          get_style_value(style_config, 'Colors', color_key, RGBColor(0, 0, 0), value_type=RGBColor),
+                          underline=True)
+    hyperlink = OxmlElement('w:hyperlink')
+    hyperlink.set(qn('w:anchor'), anchor)
+    hyperlink.set(qn('w:history'), '1')
+    hyperlink.append(run._r)  # Переносим run внутрь ссылки
+    paragraph._p.append(hyperlink)
+    return hyperlink
+
+
+def new_render_state(dedupe_shared_tasks=False):
+    return {'dedupe_shared_tasks': dedupe_shared_tasks,
+            'rendered_tasks': {},  # ключ задачи -> (имя закладки, раздел, где выведен полный блок)
+            'next_bookmark_id': 0,
+            'task_occurrences': 0,
+            'full_task_blocks': 0}
+
+
+def _add_task_block(document, task, style_config, indent, render_state, section_title):
+    """Выводит блок задачи: ключ, описание и инструкцию.
+
+    При включенной дедупликации полный блок выводится только при первом вхождении задачи,
+    а в остальных версиях остается ключ со ссылкой на закладку полного блока.
+    """
+    render_state['task_occurrences'] += 1
+    task_key = task['key']
+    already_rendered = render_state['rendered_tasks'].get(task_key)
+
+    if render_state['dedupe_shared_tasks'] and already_rendered:
+        bookmark_name, primary_section_title = already_rendered
+        p_ref = _add_formatted_paragraph(document, task_key + ": ", style_config, font_key='task_key',
+                                         fontsize_key='task_key', color_key='task_key', bold=True,
+                                         left_indent_inches=indent,
+                                         space_before_key='task_block_internal_space',
+                                         space_after_key='task_description_after')
+        _add_internal_hyperlink(p_ref, f"см. описание в разделе «{primary_section_title}»", bookmark_name,
+                                style_config)
+        return
+
+    render_state['full_task_blocks'] += 1
+    p_key = _add_formatted_paragraph(document, task_key + ":", style_config, font_key='task_key',
+                                     fontsize_key='task_key', color_key='task_key', bold=True,
+                                     left_indent_inches=indent,
+                                     space_before_key='task_block_internal_space',
+                                     space_after_key='task_key_after')
+    if render_state['dedupe_shared_tasks']:
+        bookmark_name = task_bookmark_name(task_key)
+        _add_bookmark(p_key, bookmark_name, render_state['next_bookmark_id'])
+        render_state['next_bookmark_id'] += 1
+        render_state['rendered_tasks'][task_key] = (bookmark_name, section_title)
+
+    desc = sanitize_text_docx(task['cust_desc'])
+    desc_empty = not bool(desc)
+    _add_formatted_paragraph(document, desc if not desc_empty else "Описание ... отсутствует.",
+                             style_config, font_key='main', fontsize_key='task_description',
+                             color_key='task_description', italic=desc_empty,
+                             left_indent_inches=indent,
+                             space_after_key='task_description_after' if not task[
+                                 'install_instr'] else 'task_block_internal_space')
+    if task['install_instr']:
+        _add_formatted_paragraph(document, "Инструкция:", style_config, font_key='main',
+                                 fontsize_key='install_instruction_label',
+                                 color_key='install_instruction_label', bold=True,
+                                 left_indent_inches=indent,
+                                 space_before_key='task_block_internal_space',
+                                 space_after_key='install_label_after')
+        _add_formatted_paragraph(document, sanitize_text_docx(task['install_instr']),
+                                 style_config, font_key='main',
+                                 fontsize_key='install_instruction_text',
+                                 color_key='install_instruction_text',
+                                 left_indent_inches=indent,
+                                 space_after_key='install_text_after')
+
+
+def _run_properties_xml(font_name, font_size_pt, bold, color):
+    """XML свойств run (w:rPr), эквивалентный _apply_run_formatting, для сборки таблицы одним фрагментом."""
+    font_attr = xml_escape(font_name, {'"': '&quot;'})
+    parts = [f'<w:rFonts w:ascii="{font_attr}" w:hAnsi="{font_attr}" w:eastAsia="{font_attr}" w:cs="{font_attr}"/>'
+             if font_name else '']
+    if bold: parts.append('<w:b/>')
+    if color: parts.append(f'<w:color w:val="{color}"/>')
+    if font_size_pt: parts.append(f'<w:sz w:val="{int(font_size_pt * 2)}"/>')
+    return '<w:rPr>' + ''.join(parts) + '</w:rPr>'
+
+
+def _add_table_bulk(document, header_texts, rows, style_config, col_widths_inches,
+                    header_fontsize_key='summary_table_header', text_fontsize_key='summary_table_text'):
+    """Добавляет таблицу в конец документа, собирая весь ее XML за один проход по готовым строкам.
+
+    В отличие от table.add_row().cells не обращается к объектам ячеек python-docx,
+    поэтому время построения растет линейно с числом строк.
+    """
+    font_name = get_style_value(style_config, 'Fonts', 'main', 'Arial')
+    header_rpr = _run_properties_xml(
+        font_name, get_style_value(style_config, 'FontSizes', header_fontsize_key, 11, value_type=int), True,
+        get_style_value(style_config, 'Colors', 'table_header_text', RGBColor(0, 0, 0), value_type=RGBColor))
+    text_rpr = _run_properties_xml(
+        font_name, get_style_value(style_config, 'FontSizes', text_fontsize_key, 10, value_type=int), False,
+        get_style_value(style_config, 'Colors', 'table_text', RGBColor(0, 0, 0), value_type=RGBColor))
+    col_widths_twips = [int(width * 1440) for width in col_widths_inches]
+    cell_openings = [f'<w:tc><w:tcPr><w:tcW w:w="{width}" w:type="dxa"/></w:tcPr><w:p><w:r>'
+                     for width in col_widths_twips]
+
+    try:
+        table_style_id = document.styles['Table Grid'].style_id
+    except KeyError:
+        logger.warning("Стиль таблицы 'Table Grid' не найден, таблица будет без рамок.")
+        table_style_id = None
+
+    xml_parts = [f'<w:tbl {nsdecls("w")}><w:tblPr>',
+                 f'<w:tblStyle w:val="{table_style_id}"/>' if table_style_id else '',
+                 '<w:tblW w:w="0" w:type="auto"/><w:tblLook w:val="04A0" w:firstRow="1" w:lastRow="0" '
+                 'w:firstColumn="1" w:lastColumn="0" w:noHBand="0" w:noVBand="1"/></w:tblPr><w:tblGrid>']
+    xml_parts.extend(f'<w:gridCol w:w="{width}"/>' for width in col_widths_twips)
+    xml_parts.append('</w:tblGrid>')
+    for row_texts, rpr in itertools.chain([(header_texts, header_rpr)], ((row, text_rpr) for row in rows)):
+        xml_parts.append('<w:tr>')
+        for cell_opening, cell_text in zip(cell_openings, row_texts):
+            xml_parts.append(f'{cell_opening}{rpr}<w:t xml:space="preserve">'
+                             f'{xml_escape(sanitize_text_docx(cell_text))}</w:t></w:r></w:p></w:tc>')
+        xml_parts.append('</w:tr>')
+    xml_parts.append('</w:tbl>')
+
+    table_element = parse_xml(''.join(xml_parts))
+    document.element.body._insert_tbl(table_element)  # Вставка перед w:sectPr, как у document.add_table
+    return table_element
+
+
+STATISTICS_TABLE_HEADER = ('Тип задачи', 'Клиент', 'Задач')
+
+
+def statistics_table_rows(statistics_rows):
+    """Строки таблицы статистики (тип задачи, клиент, число задач) с итоговой строкой; общие для всех форматов."""
+    table_rows = [(row['issue_type'], row['client'], str(row['count'])) for row in statistics_rows]
+    table_rows.append(("Итого", "", str(sum(row['count'] for row in statistics_rows))))
+    return table_rows
+
+
+def _add_statistics_table(document, statistics_rows, style_config):
+    """Таблица количества задач версии по типу и клиенту (строки посчитаны при группировке)."""
+    _add_formatted_paragraph(document, "Статистика задач:", style_config, font_key='main',
+                             fontsize_key='summary_table_header', color_key='sub_header', bold=True,
+                             left_indent_inches=0.25, space_after_key='after_issue_type_header', keep_with_next=True)
+    _add_table_bulk(document, STATISTICS_TABLE_HEADER, statistics_table_rows(statistics_rows), style_config,
+                    [get_style_value(style_config, 'TableLayout', f'statistics_table_col{i}_width_inches', default,
+                                     value_type=float) for i, default in ((1, 2.5), (2, 2.5), (3, 0.8))])
+    _add_formatted_paragraph(document, None, style_config, space_after_key='after_ms_version_header')
+
+
+# Оформление заголовков групп по уровню группировки; уровни без своего стиля оформляются как тип задачи
+GROUP_LEVEL_STYLES = {
+    'client': {'font_key': 'client_header', 'fontsize_key': 'client_header', 'color_key': 'client_header',
+               'space_after_key': 'after_client_header'},
+}
+DEFAULT_GROUP_LEVEL_STYLE = {'font_key': 'issue_type_header', 'fontsize_key': 'issue_type_header',
+                             'color_key': 'sub_header', 'space_after_key': 'after_issue_type_header'}
+
+
+def _render_group_tree(document, node, grouping_levels, depth, style_config, render_state, section_title):
+    """Рекурсивно выводит дерево групп: dict -> заголовки групп уровня depth, list -> блоки задач."""
+    indent = 0.25 * depth
+    if not isinstance(node, Mapping):
+        for task in node:
+            _add_task_block(document, task, style_config, indent, render_state, section_title)
+        return
+
+    level_name = grouping_levels[depth - 1] if depth - 1 < len(grouping_levels) else None
+    level_style = GROUP_LEVEL_STYLES.get(level_name, DEFAULT_GROUP_LEVEL_STYLE)
+    if depth > 1:
+        parent_level_name = grouping_levels[depth - 2] if depth - 2 < len(grouping_levels) else None
+        space_before_key = GROUP_LEVEL_STYLES.get(parent_level_name, DEFAULT_GROUP_LEVEL_STYLE)['space_after_key']
+    else:
+        space_before_key = 'after_ms_version_header'
+    for group_name, child_node in node.items():
+        _add_formatted_paragraph(document, group_name, style_config, font_key=level_style['font_key'],
+                                 fontsize_key=level_style['fontsize_key'], color_key=level_style['color_key'],
+                                 bold=True, left_indent_inches=indent, space_before_key=space_before_key,
+                                 space_after_key=level_style['space_after_key'], keep_with_next=True)
+        _render_group_tree(document, child_node, grouping_levels, depth + 1, style_config, render_state,
+                           section_title)
+
+
+def get_ms_version_display_name(ms_version_key, main_config_data):
+    """Полное имя версии микросервиса по шаблону из [MicroserviceVersions], например FR2.3.6 -> Phobos-front (версия 2.3.6)."""
+    if not main_config_data:
+        return ms_version_key
+    match = re.match(r"^([A-Z]{2})(\d+(\.\d+){1,2})$", ms_version_key)
+    if match:
+        template = main_config_data.get('MicroserviceVersions', {}).get(match.group(1).upper())
+        if template:
+            return template.replace("{{version}}", match.group(2))
+    return ms_version_key
+
+
 def extract_microservice_info_for_summary_table(grouped_data_keys, main_config_data):
     # ... (код этой функции без изменений, как в предыдущем полном ответе) ...
     logger_func = logging.getLogger(__name__)
@@ -161,12 +388,42 @@ def extract_microservice_info_for_summary_table(grouped_data_keys, main_config_d
     return microservices_summary
 
 
-def create_release_notes_docx(output_filename, title, grouped_data,
-                              use_client_grouping_flag, use_issue_type_grouping_flag,
-                              microservices_summary_data=None,
-                              main_config=None, style_config=None):
+def save_document(document, output_filename, fixed_timestamp=None):
+    """Сохраняет документ. С fixed_timestamp результат побайтно воспроизводим:
+    даты в свойствах документа и время записей zip берутся из него, записи идут в фиксированном порядке.
+    """
+    if fixed_timestamp is None:
+        document.save(output_filename)
+        return
+
+    naive_utc_timestamp = fixed_timestamp.astimezone(timezone.utc).replace(tzinfo=None) \
+        if fixed_timestamp.tzinfo else fixed_timestamp
+    core_properties = document.core_properties
+    core_properties.created = naive_utc_timestamp
+    core_properties.modified = naive_utc_timestamp
+    core_properties.last_printed = naive_utc_timestamp
+    core_properties.revision = 1
+
+    buffer = io.BytesIO()
+    document.save(buffer)
+    # В zip нельзя записать время раньше 1980 года
+    zip_date_time = max(naive_utc_timestamp, datetime(1980, 1, 1)).timetuple()[:6]
+    with zipfile.ZipFile(buffer) as source_zip:
+        # [Content_Types].xml по соглашению OPC идет первым, остальные записи - по имени
+        entry_names = sorted(source_zip.namelist(), key=lambda name: (name != '[Content_Types].xml', name))
+        with zipfile.ZipFile(output_filename, 'w', zipfile.ZIP_DEFLATED) as target_zip:
+            for entry_name in entry_names:
+                entry_info = zipfile.ZipInfo(entry_name, date_time=zip_date_time)
+                entry_info.compress_type = zipfile.ZIP_DEFLATED
+                entry_info.create_system = 0
+                entry_info.external_attr = 0o644 << 16
+                target_zip.writestr(entry_info, source_zip.read(entry_name))
+
+
+def begin_release_notes_document(title, has_tasks, microservices_summary_data=None,
+                                 main_config=None, style_config=None, generated_at=None):
+    """Создает документ и выводит его шапку: стиль Normal, логотип, заголовок, дату и сводную таблицу."""
     document = Document()
-    logger.info(f"Создание DOCX: {output_filename}")
 
     # Настройка стиля 'Normal'
     s_font_main = get_style_value(style_config, 'Fonts', 'main', 'Arial')
@@ -211,7 +468,7 @@ def create_release_notes_docx(output_filename, title, grouped_data,
     # Заголовок и дата
     _add_formatted_paragraph(document, title, style_config, font_key='title', fontsize_key='title', color_key='title',
                              bold=True, alignment=WD_ALIGN_PARAGRAPH.CENTER, space_after_key='after_title')
-    _add_formatted_paragraph(document, f"Дата генерации: {datetime.now().strftime('%Y-%m-%d %H:%M')}", style_config,
+    _add_formatted_paragraph(document, f"Дата генерации: {(generated_at or datetime.now()).strftime('%Y-%m-%d %H:%M')}", style_config,
                              font_key='main', fontsize_key='date', color_key='date_text', italic=True,
                              alignment=WD_ALIGN_PARAGRAPH.CENTER, space_after_key='after_date')
 
@@ -221,163 +478,106 @@ def create_release_notes_docx(output_filename, title, grouped_data,
                                  fontsize_key='summary_table_title', color_key='summary_table_title', bold=True,
                                  space_after_key='after_summary_table_title', keep_with_next=True)
         if microservices_summary_data:
-            table = document.add_table(rows=1, cols=2)  # ... (код создания и форматирования таблицы как раньше)
-            table.style = 'Table Grid'
-            table.columns[0].width = Inches(
-                get_style_value(style_config, 'TableLayout', 'summary_table_col1_width_inches', 4.0, value_type=float))
-            table.columns[1].width = Inches(
-                get_style_value(style_config, 'TableLayout', 'summary_table_col2_width_inches', 1.5, value_type=float))
-            hdr_font = get_style_value(style_config, 'Fonts', 'main', 'Arial')
-            hdr_fontsize = get_style_value(style_config, 'FontSizes', 'summary_table_header', 11, value_type=int)
-            hdr_color = get_style_value(style_config, 'Colors', 'table_header_text', RGBColor(0, 0, 0),
-                                        value_type=RGBColor)
-            hdr_cells = table.rows[0].cells;
-            col_texts = ['Микросервис', 'Версия']
-            for i, cell_text in enumerate(col_texts):
-                p = hdr_cells[i].paragraphs[0];
-                p.text = "";
-                run = p.add_run(cell_text)
-                _apply_run_formatting(run, hdr_font, hdr_fontsize, True, False, color=hdr_color)
-            cell_font = get_style_value(style_config, 'Fonts', 'main', 'Arial')
-            cell_fontsize = get_style_value(style_config, 'FontSizes', 'summary_table_text', 10, value_type=int)
-            cell_color = get_style_value(style_config, 'Colors', 'table_text', RGBColor(0, 0, 0), value_type=RGBColor)
-            for item in microservices_summary_data:
-                row_cells = table.add_row().cells;
-                texts_to_add = [item.get('service_name', 'N/A'), item.get('version_number', 'N/A')]
-                for i, cell_content in enumerate(texts_to_add):
-                    row_cells[i].text = cell_content
-                    if row_cells[i].paragraphs:
-                        p_cell = row_cells[i].paragraphs[0]
-                        current_run = p_cell.runs[0] if p_cell.runs else p_cell.add_run(cell_content)
-                        if not current_run.text and cell_content: current_run.text = cell_content
-                        _apply_run_formatting(current_run, cell_font, cell_fontsize, False, False, color=cell_color)
+            summary_rows = [(item.get('service_name', 'N/A'), item.get('version_number', 'N/A'))
+                            for item in microservices_summary_data]
+            _add_table_bulk(document, ['Микросервис', 'Версия'], summary_rows, style_config,
+                            [get_style_value(style_config, 'TableLayout', 'summary_table_col1_width_inches', 4.0,
+                                             value_type=float),
+                             get_style_value(style_config, 'TableLayout', 'summary_table_col2_width_inches', 1.5,
+                                             value_type=float)])
             logger.info("Таблица микросервисов добавлена.")
         else:
             _add_formatted_paragraph(document, "Информация о версиях микросервисов отсутствует.", style_config,
                                      fontsize_key='normal_style_base', italic=True)
         _add_formatted_paragraph(document, None, style_config, space_after_key='after_summary_table')
-    elif grouped_data:
+    elif has_tasks:
         _add_formatted_paragraph(document, None, style_config, space_after_key='normal_paragraph_after')
 
-    # Детализация задач
-    if not grouped_data:
-        if not microservices_summary_data: _add_formatted_paragraph(document, "Нет задач для отображения.",
-                                                                    style_config, font_key='main',
-                                                                    fontsize_key='normal_style_base')
-    else:
-        microservice_version_pattern_docx = re.compile(r"^([A-Z]{2})(\d+(\.\d+){1,2})$")
-        sorted_ms_versions_original = sorted(grouped_data.keys())
-
-        for ms_idx, ms_version_original_key in enumerate(sorted_ms_versions_original):
-            display_ms_version = ms_version_original_key
-            if main_config:  # Получаем display_ms_version
-                match = microservice_version_pattern_docx.match(ms_version_original_key)
-                if match:
-                    prefix = match.group(1).upper();
-                    version_num = match.group(2)
-                    template = main_config.get('MicroserviceVersions', {}).get(prefix)
-                    if template: display_ms_version = template.replace("{{version}}", version_num)
-
-            _add_formatted_paragraph(document, display_ms_version, style_config, font_key='section_header',
-                                     fontsize_key='ms_version_header', color_key='section_header', bold=True,
-                                     space_before_key='section_after_space' if ms_idx > 0 else None,
-                                     space_after_key='after_ms_version_header', keep_with_next=True)
-
-            data_for_current_ms = grouped_data[ms_version_original_key]
-            client_or_type_keys = sorted(data_for_current_ms.keys(),
-                                         key=lambda k: (k.lower() == "не указан" or k.lower() == "общие задачи",
-                                                        k.lower())) if isinstance(data_for_current_ms, dict) else []
-
-            if use_client_grouping_flag:
-                for client_name_display in client_or_type_keys:
-                    _add_formatted_paragraph(document, client_name_display, style_config, font_key='client_header',
-                                             fontsize_key='client_header', color_key='client_header', bold=True,
-                                             left_indent_inches=0.25, space_before_key='after_ms_version_header',
-                                             space_after_key='after_client_header', keep_with_next=True)
-                    data_for_current_client = data_for_current_ms[client_name_display]
-                    if use_issue_type_grouping_flag and isinstance(data_for_current_client, dict):
-                        issue_type_keys = sorted(data_for_current_client.keys(),
-                                                 key=lambda k: (k.lower() == "не указан тип" or k.lower() == "задачи",
-                                                                k.lower()))
-                        for issue_type_name in issue_type_keys:
-                            _add_formatted_paragraph(document, issue_type_name, style_config,
-                                                     font_key='issue_type_header', fontsize_key='issue_type_header',
-                                                     color_key='sub_header', bold=True, left_indent_inches=0.50,
-                                                     space_before_key='after_client_header',
-                                                     space_after_key='after_issue_type_header', keep_with_next=True)
-                            tasks = data_for_current_client[issue_type_name];
-                            current_indent = 0.75
-                            for task in tasks:  # Вывод задач
-                                _add_formatted_paragraph(document, task['key'] + ":", style_config, font_key='task_key',
-                                                         fontsize_key='task_key', color_key='task_key', bold=True,
-                                                         left_indent_inches=current_indent,
-                                                         space_before_key='task_block_internal_space',
-                                                         space_after_key='task_key_after')
-                                desc = sanitize_text_docx(task['cust_desc']);
-                                desc_empty = not bool(desc)
-                                _add_formatted_paragraph(document,
-                                                         desc if not desc_empty else "Описание ... отсутствует.",
-                                                         style_config, font_key='main', fontsize_key='task_description',
-                                                         color_key='task_description', italic=desc_empty,
-                                                         left_indent_inches=current_indent,
-                                                         space_after_key='task_description_after' if not task[
-                                                             'install_instr'] else 'task_block_internal_space')
-                                if task['install_instr']:
-                                    _add_formatted_paragraph(document, "Инструкция:", style_config, font_key='main',
-                                                             fontsize_key='install_instruction_label',
-                                                             color_key='install_instruction_label', bold=True,
-                                                             left_indent_inches=current_indent,
-                                                             space_before_key='task_block_internal_space',
-                                                             space_after_key='install_label_after')
-                                    _add_formatted_paragraph(document, sanitize_text_docx(task['install_instr']),
-                                                             style_config, font_key='main',
-                                                             fontsize_key='install_instruction_text',
-                                                             color_key='install_instruction_text',
-                                                             left_indent_inches=current_indent,
-                                                             space_after_key='install_text_after')
-                    elif isinstance(data_for_current_client, list):  # Задачи под клиентом
-                        tasks = data_for_current_client;
-                        current_indent = 0.50
-                        for task in tasks:  # Вывод задач
-                            _add_formatted_paragraph(document, task['key'] + ":", style_config, font_key='task_key',
-                                                     fontsize_key='task_key', color_key='task_key', bold=True,
-                                                     left_indent_inches=current_indent,
-                                                     space_before_key='task_block_internal_space',
-                                                     space_after_key='task_key_after')
-                            # ... и т.д. для описания и инструкции ...
-            elif use_issue_type_grouping_flag:  # Только типы, без клиентов
-                for issue_type_name in client_or_type_keys:  # Здесь это типы
-                    _add_formatted_paragraph(document, issue_type_name, style_config, font_key='issue_type_header',
-                                             fontsize_key='issue_type_header', color_key='sub_header', bold=True,
-                                             left_indent_inches=0.25, space_before_key='after_ms_version_header',
-                                             space_after_key='after_issue_type_header', keep_with_next=True)
-                    tasks = data_for_current_ms[issue_type_name];
-                    current_indent = 0.50
-                    for task in tasks:  # Вывод задач
-                        _add_formatted_paragraph(document, task['key'] + ":", style_config, font_key='task_key',
-                                                 fontsize_key='task_key', color_key='task_key', bold=True,
-                                                 left_indent_inches=current_indent,
-                                                 space_before_key='task_block_internal_space',
-                                                 space_after_key='task_key_after')
-                        # ... и т.д. для описания и инструкции ...
-            else:  # Нет вложенных группировок
-                tasks = data_for_current_ms;
-                current_indent = 0.25
-                for task in tasks:  # Вывод задач
-                    _add_formatted_paragraph(document, task['key'] + ":", style_config, font_key='task_key',
-                                             fontsize_key='task_key', color_key='task_key', bold=True,
-                                             left_indent_inches=current_indent,
-                                             space_before_key='task_block_internal_space',
-                                             space_after_key='task_key_after')
-                    # ... и т.д. для описания и инструкции ...
-
-            if ms_idx < len(sorted_ms_versions_original) - 1:
-                _add_formatted_paragraph(document, None, style_config, space_after_key='section_after_space')
+    if not has_tasks and not microservices_summary_data:
+        _add_formatted_paragraph(document, "Нет задач для отображения.", style_config, font_key='main',
+                                 fontsize_key='normal_style_base')
+    return document
+
+
+def add_version_section(document, ms_idx, ms_version_original_key, version_subtree, grouping_levels,
+                        render_state, main_config=None, style_config=None, statistics_rows=None):
+    """Выводит раздел одной версии микросервиса; ms_idx - порядковый номер раздела в документе."""
+    if ms_idx > 0:  # Отступ между разделами версий
+        _add_formatted_paragraph(document, None, style_config, space_after_key='section_after_space')
+
+    display_ms_version = get_ms_version_display_name(ms_version_original_key, main_config)
+    _add_formatted_paragraph(document, display_ms_version, style_config, font_key='section_header',
+                             fontsize_key='ms_version_header', color_key='section_header', bold=True,
+                             space_before_key='section_after_space' if ms_idx > 0 else None,
+                             space_after_key='after_ms_version_header', keep_with_next=True)
+
+    if statistics_rows:
+        _add_statistics_table(document, statistics_rows, style_config)
+
+    _render_group_tree(document, version_subtree, grouping_levels, 1, style_config, render_state,
+                       display_ms_version)
+
+
+def finish_release_notes_document(document, output_filename, render_state, render_stats=None,
+                                  fixed_timestamp=None):
+    """Сохраняет документ и переносит счетчики вывода задач в render_stats."""
+    if render_stats is not None:
+        render_stats['task_occurrences'] = render_state['task_occurrences']
+        render_stats['full_task_blocks'] = render_state['full_task_blocks']
 
     try:
-        document.save(output_filename)
+        save_document(document, output_filename, fixed_timestamp)
+        logger.info(f"DOCX '{output_filename}' успешно сохранен.")
+        return True
+    except Exception as e:
+        logger.error(f"Ошибка при сохранении DOCX '{output_filename}': {e}", exc_info=True)
+        return False
+
+
+def create_release_notes_docx(output_filename, title, grouped_data, grouping_levels=(),
+                              microservices_summary_data=None,
+                              main_config=None, style_config=None,
+                              dedupe_shared_tasks=False, render_stats=None, generated_at=None,
+                              statistics_data=None, reproducible=False):
+    logger.info(f"Создание DOCX: {output_filename}")
+    document = begin_release_notes_document(title, bool(grouped_data), microservices_summary_data,
+                                            main_config, style_config, generated_at)
+    render_state = new_render_state(dedupe_shared_tasks)
+
+    # Детализация задач; ключи версий уже упорядочены при группировке
+    for ms_idx, (ms_version_original_key, version_subtree) in enumerate(grouped_data.items()):
+        add_version_section(document, ms_idx, ms_version_original_key, version_subtree, grouping_levels,
+                            render_state, main_config, style_config,
+                            statistics_rows=(statistics_data or {}).get(ms_version_original_key))
+
+    return finish_release_notes_document(document, output_filename, render_state, render_stats,
+                                         generated_at if reproducible else None)
+
+
+def create_volume_index_docx(output_filename, title, volumes, main_config=None, style_config=None,
+                             generated_at=None, reproducible=False):
+    """Главный документ разбитого на тома релиза: для каждого тома - файл, число задач и состав микросервисов.
+
+    volumes - список dict {'file_name', 'task_count', 'microservices_summary_data'} в порядке томов.
+    """
+    logger.info(f"Создание оглавления томов DOCX: {output_filename}")
+    document = begin_release_notes_document(title, bool(volumes), None, main_config, style_config, generated_at)
+    col_widths_inches = [get_style_value(style_config, 'TableLayout', f'summary_table_col{i}_width_inches', default,
+                                         value_type=float) for i, default in ((1, 4.0), (2, 1.5))]
+    for volume_idx, volume in enumerate(volumes, start=1):
+        _add_formatted_paragraph(document, f"Том {volume_idx}: {volume['file_name']} (задач: {volume['task_count']})",
+                                 style_config, font_key='section_header', fontsize_key='summary_table_title',
+                                 color_key='summary_table_title', bold=True,
+                                 space_after_key='after_summary_table_title', keep_with_next=True)
+        summary_rows = [(item.get('service_name', 'N/A'), item.get('version_number', 'N/A'))
+                        for item in volume['microservices_summary_data']]
+        _add_table_bulk(document, ['Микросервис', 'Версия'], summary_rows, style_config, col_widths_inches)
+        _add_formatted_paragraph(document, None, style_config, space_after_key='after_summary_table')
+
+    try:
+        save_document(document, output_filename, generated_at if reproducible else None)
         logger.info(f"DOCX '{output_filename}' успешно сохранен.")
         return True
     except Exception as e:
         logger.error(f"Ошибка при сохранении DOCX '{output_filename}': {e}", exc_info=True)
-        return False
\ No newline at end of file
+        return False
@@ -5,12 +5,15 @@ import sys
 import os
 import configparser
 import re
+from datetime import datetime, timezone
 
 # Предполагается, что csv_importer.py и docx_creator.py находятся в той же директории
 import csv_importer
 
 try:
     import docx_creator
+    import pipeline
+    import renderers
 except ImportError:
     # Сообщение об ошибке выведет сам docx_creator при попытке импорта docx
     sys.exit(1)
@@ -77,6 +80,16 @@ def load_all_configs(main_config_path=DEFAULT_MAIN_CONFIG_FILE):
             'release_title_format': "{{global_version}}",
             'use_issue_type_grouping': 'true',
             'use_client_grouping': 'false',  # По умолчанию группировка по клиенту отключена
+            'grouping_levels': '',  # Если пусто - уровни определяются флагами use_client_grouping/use_issue_type_grouping
+            'output_formats': 'docx',  # Через запятую: docx, md, html, json
+            'include_statistics_tables': 'false',  # Таблицы числа задач по типу и клиенту в каждой версии
+            'reproducible_output': 'false',  # Побайтно одинаковый результат на одинаковых входных данных
+            'split_by_client': 'false',  # Отдельные файлы всех форматов для каждого клиента
+            'render_workers': '',  # Число процессов для параллельного рендера DOCX; пусто - по числу CPU
+            'volume_max_tasks': '',  # Разбиение DOCX на тома: не больше задач в томе; пусто - без ограничения
+            'volume_max_size_kb': '',  # Разбиение DOCX на тома: примерный объем несжатого XML тома в КБ; пусто - без ограничения
+            'pipelined': 'false',  # Конвейер: чтение, группировка и рендер DOCX в отдельных потоках
+            'dedupe_shared_tasks': 'false',  # Полный блок задачи только в первой версии, в остальных - ссылка
             'styles_config_file': DEFAULT_STYLES_CONFIG_FILE
         },
         'Columns': {
@@ -112,7 +125,9 @@ def load_all_configs(main_config_path=DEFAULT_MAIN_CONFIG_FILE):
                     'after_issue_type_header': '4', 'task_key_after': '1', 'task_description_after': '2',
                     'install_label_after': '1', 'install_text_after': '8', 'section_after_space': '12',
                     'normal_paragraph_after': '6'},
-        'TableLayout': {'summary_table_col1_width_inches': '4.0', 'summary_table_col2_width_inches': '1.5'}
+        'TableLayout': {'summary_table_col1_width_inches': '4.0', 'summary_table_col2_width_inches': '1.5',
+                        'statistics_table_col1_width_inches': '2.5', 'statistics_table_col2_width_inches': '2.5',
+                        'statistics_table_col3_width_inches': '0.8'}
     }
 
     styles_file_path = main_config_data.get('General', {}).get('styles_config_file', DEFAULT_STYLES_CONFIG_FILE)
@@ -126,6 +141,63 @@ def load_all_configs(main_config_path=DEFAULT_MAIN_CONFIG_FILE):
     return main_config_data, styles_config_data
 
 
+def _log_run_summary(logger, render_stats):
+    """Итоговая статистика прогона: сколько вхождений задач и сколько полных блоков выведено."""
+    occurrences = render_stats.get('task_occurrences', 0)
+    full_blocks = render_stats.get('full_task_blocks', 0)
+    dedupe_ratio = occurrences / full_blocks if full_blocks else 1.0
+    logger.info(f"Итог: вхождений задач по версиям: {occurrences}, полных блоков задач: {full_blocks}, "
+                f"коэффициент дедупликации: {dedupe_ratio:.2f}x (ссылок вместо блоков: {occurrences - full_blocks})")
+
+
+def _resolve_generation_timestamp(source_date_epoch_arg, reproducible):
+    """Дата генерации отчета: --source-date-epoch > SOURCE_DATE_EPOCH > (в воспроизводимом режиме) эпоха 0 > now.
+
+    В воспроизводимом режиме дата не берется из файловой системы (например, mtime CSV):
+    одна и та же выгрузка, скачанная дважды, должна давать побайтно одинаковый результат.
+    """
+    logger = logging.getLogger(__name__)
+    epoch = source_date_epoch_arg
+    if epoch is None and os.environ.get('SOURCE_DATE_EPOCH'):
+        try:
+            epoch = int(os.environ['SOURCE_DATE_EPOCH'])
+        except ValueError:
+            logger.warning(f"Некорректное значение SOURCE_DATE_EPOCH '{os.environ['SOURCE_DATE_EPOCH']}', игнорируется.")
+    if epoch is None and reproducible:
+        epoch = 0
+        logger.warning("SOURCE_DATE_EPOCH не задан, в воспроизводимом режиме используется фиксированная дата "
+                       "1970-01-01 (время записей zip - 1980-01-01).")
+    if epoch is None:
+        return datetime.now()
+    return datetime.fromtimestamp(epoch, tz=timezone.utc)
+
+
+def build_release_title(main_cfg, global_version_part):
+    """Заголовок релиза: release_title_override или release_title_format с подставленной глобальной версией."""
+    logger = logging.getLogger(__name__)
+    release_title_override = main_cfg['General'].get('release_title_override')
+    if release_title_override:
+        final_release_title = release_title_override
+    else:
+        title_format_template = main_cfg['General'].get('release_title_format', "{{global_version}}")
+        if global_version_part:
+            final_release_title = title_format_template.replace("{{global_version}}", global_version_part)
+        else:
+            default_title_if_no_global = "Описание Релиза"
+            if title_format_template and title_format_template != "{{global_version}}":
+                final_release_title = title_format_template.replace("{{global_version}}", "Не указана").strip().rstrip(
+                    ':').strip()
+                if not final_release_title or final_release_title == main_cfg['General'].get('release_title_format',
+                                                                                             "").replace(
+                        "{{global_version}}", "").strip().rstrip(':').strip():
+                    final_release_title = default_title_if_no_global
+            else:
+                final_release_title = default_title_if_no_global
+            logger.warning(f"Глобальная версия не найдена, используется '{final_release_title}'")
+    logger.info(f"Финальный заголовок: '{final_release_title}'")
+    return final_release_title
+
+
 def main():
     setup_logging()
     logger = logging.getLogger(__name__)
@@ -136,6 +208,9 @@ def main():
     parser.add_argument("--styles-config", help="Конфиг стилей (переопред. значение из основного конфига)")
     parser.add_argument("--csv-file", help="Входной CSV (переопред. значение из основного конфига)")
     parser.add_argument("--docx-file", help="Выходной DOCX (переопред. значение из основного конфига)")
+    parser.add_argument("--formats",
+                        help="Форматы вывода через запятую: docx, md, html, json (по умолч. из основного конфига). "
+                             "Имена файлов берутся из выходного DOCX с заменой расширения")
 
     # Аргументы для переопределения имен колонок
     parser.add_argument("--col-key", help=f"Переопределить имя колонки ключа задачи")
@@ -148,6 +223,33 @@ def main():
     # Флаги для управления группировкой
     parser.add_argument("--no-issue-type-grouping", action='store_true', help="Отключить группировку по типу задачи")
     parser.add_argument("--no-client-grouping", action='store_true', help="Отключить группировку по клиенту")
+    parser.add_argument("--grouping-levels",
+                        help="Уровни группировки под версией микросервиса через запятую, например: "
+                             "client,issue_type,component (имена колонок для своих уровней - в [Columns])")
+    parser.add_argument("--statistics-tables", action='store_true',
+                        help="Добавить в каждую версию таблицу количества задач по типу и клиенту")
+    parser.add_argument("--reproducible", action='store_true',
+                        help="Воспроизводимый результат: дата генерации из SOURCE_DATE_EPOCH, "
+                             "фиксированные даты и порядок записей внутри DOCX")
+    parser.add_argument("--source-date-epoch", type=int,
+                        help="Дата генерации в секундах Unix (переопределяет переменную окружения SOURCE_DATE_EPOCH)")
+    parser.add_argument("--split-by-client", action='store_true',
+                        help="Создать отдельные файлы всех форматов для каждого клиента (имя файла дополняется именем клиента)")
+    parser.add_argument("--workers", type=int, help="Число процессов для параллельного рендера DOCX")
+    parser.add_argument("--volume-max-tasks", type=int,
+                        help="Разбить DOCX на тома не больше чем по столько задач (по границам версий микросервисов)")
+    parser.add_argument("--volume-max-size-kb", type=int,
+                        help="Разбить DOCX на тома по примерному объему несжатого XML документа (word/document.xml) "
+                             "в КБ, по границам версий; файл .docx сжат и в несколько раз меньше")
+    parser.add_argument("--only-services",
+                        help="Оставить только эти микросервисы: префиксы или версии через запятую (FR,IN1.4)")
+    parser.add_argument("--client", action='append',
+                        help="Оставить задачи только этого клиента (можно указать несколько раз)")
+    parser.add_argument("--pipelined", action='store_true',
+                        help="Конвейерный режим: чтение CSV, группировка и рендер DOCX идут параллельно "
+                             "в отдельных потоках с ограниченными очередями")
+    parser.add_argument("--dedupe-shared-tasks", action='store_true',
+                        help="Выводить задачу нескольких микросервисов один раз, в остальных версиях - ссылка на нее")
 
     args = parser.parse_args()
 
@@ -186,6 +288,45 @@ def main():
     col_cfg['use_client_grouping'] = not args.no_client_grouping if args.no_client_grouping \
         else main_cfg['General'].get('use_client_grouping', 'false').lower() == 'true'
 
+    # Уровни группировки под версией микросервиса: явный список либо клиент/тип по флагам выше
+    grouping_levels_str = args.grouping_levels if args.grouping_levels is not None \
+        else main_cfg['General'].get('grouping_levels', '')
+    if grouping_levels_str:
+        grouping_levels = [level.strip() for level in grouping_levels_str.split(',') if level.strip()]
+    else:
+        grouping_levels = (['client'] if col_cfg['use_client_grouping'] else []) + \
+                          (['issue_type'] if col_cfg['use_issue_type_grouping'] else [])
+    if args.no_client_grouping and 'client' in grouping_levels: grouping_levels.remove('client')
+    if args.no_issue_type_grouping and 'issue_type' in grouping_levels: grouping_levels.remove('issue_type')
+    col_cfg['grouping_levels'] = grouping_levels
+    col_cfg['use_client_grouping'] = 'client' in grouping_levels
+    col_cfg['use_issue_type_grouping'] = 'issue_type' in grouping_levels
+    # Для своих уровней (component, priority, epic...) имя колонки берется из [Columns], иначе совпадает с уровнем
+    col_cfg['group_columns'] = {level: main_cfg['Columns'].get(level) or level for level in grouping_levels
+                                if level not in ('client', 'issue_type')}
+
+    col_cfg['include_statistics'] = args.statistics_tables or \
+        main_cfg['General'].get('include_statistics_tables', 'false').lower() == 'true'
+
+    reproducible = args.reproducible or main_cfg['General'].get('reproducible_output', 'false').lower() == 'true'
+    generated_at = _resolve_generation_timestamp(args.source_date_epoch, reproducible)
+
+    col_cfg['split_by_client'] = args.split_by_client or \
+        main_cfg['General'].get('split_by_client', 'false').lower() == 'true'
+    col_cfg['only_services'] = [s.strip() for s in (args.only_services or '').split(',') if s.strip()]
+    col_cfg['only_clients'] = [c.strip() for c in (args.client or []) if c.strip()]
+    render_workers = args.workers or int(main_cfg['General'].get('render_workers') or 0) or None
+    volume_max_tasks = args.volume_max_tasks or int(main_cfg['General'].get('volume_max_tasks') or 0) or None
+    volume_max_size_kb = args.volume_max_size_kb or int(main_cfg['General'].get('volume_max_size_kb') or 0) or None
+    split_into_volumes = bool(volume_max_tasks or volume_max_size_kb)
+
+    pipelined = args.pipelined or main_cfg['General'].get('pipelined', 'false').lower() == 'true'
+
+    output_formats = [f.strip().lower() for f in
+                      (args.formats or main_cfg['General'].get('output_formats', 'docx')).split(',') if f.strip()]
+    dedupe_shared_tasks = args.dedupe_shared_tasks or \
+        main_cfg['General'].get('dedupe_shared_tasks', 'false').lower() == 'true'
+
     logger.info(f"--- Начало генерации отчета ---")
     logger.info(f"Основной конфиг: {os.path.abspath(args.config)}")
     # Определяем фактический путь к файлу стилей для логирования
@@ -198,60 +339,117 @@ def main():
     logger.info(f"Конфиг стилей: {os.path.abspath(actual_styles_config_path)}")
     logger.info(f"Входной CSV: {os.path.abspath(csv_fpath)}")
     logger.info(f"Выходной DOCX: {os.path.abspath(docx_fpath)}")
-    logger.info(
-        f"Настройки группировки: по клиенту={col_cfg['use_client_grouping']}, по типу={col_cfg['use_issue_type_grouping']}")
-
-    raw_task_data, header_map, fix_versions_col_indices, issue_type_col_idx, client_contract_col_idx = \
-        csv_importer.load_and_process_issues(csv_fpath, col_cfg)
-    if raw_task_data is None: sys.exit(1)
-
-    global_version_part = csv_importer.find_global_version_title(raw_task_data, fix_versions_col_indices)
-    release_title_override = main_cfg['General'].get('release_title_override')
-    if release_title_override:
-        final_release_title = release_title_override
+    logger.info(f"Форматы вывода: {', '.join(output_formats)}")
+    logger.info(f"Уровни группировки: {', '.join(grouping_levels) or 'нет'}")
+    logger.info(f"Таблицы статистики по версиям: {col_cfg['include_statistics']}")
+    logger.info(f"Воспроизводимый режим: {reproducible}, дата генерации: {generated_at.isoformat()}")
+    logger.info(f"Отдельные файлы на клиента: {col_cfg['split_by_client']}")
+    if col_cfg['only_services'] or col_cfg['only_clients']:
+        logger.info(f"Фильтры строк: микросервисы={col_cfg['only_services'] or 'все'}, "
+                    f"клиенты={col_cfg['only_clients'] or 'все'}")
+    if split_into_volumes:
+        logger.info(f"Разбиение DOCX на тома: задач в томе {volume_max_tasks or 'без ограничения'}, "
+                    f"объем XML тома {f'{volume_max_size_kb} КБ' if volume_max_size_kb else 'без ограничения'}")
+    logger.info(f"Конвейерный режим: {pipelined}")
+    logger.info(f"Дедупликация задач нескольких микросервисов: {dedupe_shared_tasks}")
+
+    stats_by_format = {}
+    written_files = {}
+    formats_to_render = output_formats
+    if pipelined and col_cfg['split_by_client']:
+        logger.warning("Конвейерный режим не совместим с разбиением по клиентам - используется обычный режим.")
+        pipelined = False
+    if split_into_volumes and col_cfg['split_by_client']:
+        logger.warning("Разбиение на тома не применяется вместе с разбиением по клиентам - тома отключены.")
+        split_into_volumes = False
+    if pipelined and split_into_volumes:
+        logger.warning("Конвейерный режим не совместим с разбиением на тома - используется обычный режим.")
+        pipelined = False
+    if pipelined and 'docx' in output_formats:
+        logger.info(f"Конвейерная генерация DOCX: '{docx_fpath}'...")
+        stats_by_format['docx'] = {}
+        pipeline_result = pipeline.run_pipelined_docx(
+            csv_fpath, col_cfg, main_cfg, styles_cfg, docx_fpath,
+            lambda global_version_part: build_release_title(main_cfg, global_version_part),
+            dedupe_shared_tasks=dedupe_shared_tasks, collect_statistics=col_cfg['include_statistics'],
+            generated_at=generated_at, reproducible=reproducible, render_stats=stats_by_format['docx'])
+        if pipeline_result is None:
+            logger.error("--- Ошибки при создании отчета. ---"); sys.exit(1)
+        final_release_title, grouped_issues_data, grouping_levels, statistics_data = pipeline_result
+        written_files['docx'] = docx_fpath
+        formats_to_render = [f for f in output_formats if f != 'docx']
     else:
-        title_format_template = main_cfg['General'].get('release_title_format', "{{global_version}}")
-        if global_version_part:
-            final_release_title = title_format_template.replace("{{global_version}}", global_version_part)
-        else:
-            default_title_if_no_global = "Описание Релиза"
-            if title_format_template and title_format_template != "{{global_version}}":
-                final_release_title = title_format_template.replace("{{global_version}}", "Не указана").strip().rstrip(
-                    ':').strip()
-                if not final_release_title or final_release_title == main_cfg['General'].get('release_title_format',
-                                                                                             "").replace(
-                        "{{global_version}}", "").strip().rstrip(':').strip():
-                    final_release_title = default_title_if_no_global
-            else:
-                final_release_title = default_title_if_no_global
-            logger.warning(f"Глобальная версия не найдена, используется '{final_release_title}'")
-    logger.info(f"Финальный заголовок: '{final_release_title}'")
-
-    logger.info("Группировка задач...")
-    grouped_issues_data = csv_importer.group_issues(
-        raw_task_data, header_map, col_cfg,
-        fix_versions_col_indices, issue_type_col_idx, client_contract_col_idx,
-        main_cfg  # Передаем основной конфиг для маппинга IssueTypeNames
-    )
-    if grouped_issues_data is None: sys.exit(1)
+        if pipelined:
+            logger.warning("Конвейерный режим применяется только к DOCX, DOCX не запрошен - обычный режим.")
+        raw_task_data, header_map, fix_versions_col_indices, issue_type_col_idx, client_contract_col_idx, \
+            group_col_indices = csv_importer.load_and_process_issues(csv_fpath, col_cfg)
+        if raw_task_data is None: sys.exit(1)
+
+        logger.info("Группировка задач...")
+        statistics_data = {} if col_cfg['include_statistics'] else None
+        grouped_issues_data, grouping_levels, global_version_part = csv_importer.group_issues(
+            raw_task_data, header_map, col_cfg,
+            fix_versions_col_indices, issue_type_col_idx, client_contract_col_idx,
+            main_cfg,  # Передаем основной конфиг для маппинга IssueTypeNames
+            statistics=statistics_data, group_col_indices=group_col_indices
+        )
+        if grouped_issues_data is None: sys.exit(1)
+        final_release_title = build_release_title(main_cfg, global_version_part)
 
     ms_summary_data = []
     if grouped_issues_data:
         ms_summary_data = docx_creator.extract_microservice_info_for_summary_table(grouped_issues_data.keys(), main_cfg)
 
-    logger.info(f"Генерация DOCX: '{docx_fpath}' для релиза '{final_release_title}'...")
-    success = docx_creator.create_release_notes_docx(
-        docx_fpath, final_release_title, grouped_issues_data,
-        col_cfg['use_client_grouping'],
-        col_cfg['use_issue_type_grouping'],
-        microservices_summary_data=ms_summary_data,
-        main_config=main_cfg, style_config=styles_cfg
-    )
-
-    if success:
-        logger.info(f"--- Генерация отчета успешно завершена: {os.path.abspath(docx_fpath)} ---")
+    logger.info(f"Генерация отчета ({', '.join(formats_to_render) or 'нет других форматов'}) для релиза '{final_release_title}'...")
+    release_model = {
+        'title': final_release_title,
+        'generated_at': generated_at,
+        'reproducible': reproducible,
+        'grouped_data': grouped_issues_data,
+        'grouping_levels': grouping_levels,  # Фактические уровни после группировки
+        'microservices_summary_data': ms_summary_data,
+        'statistics': statistics_data,
+        'main_config': main_cfg,
+        'style_config': styles_cfg,
+        'dedupe_shared_tasks': dedupe_shared_tasks
+    }
+    if col_cfg['split_by_client'] and formats_to_render:
+        client_files = renderers.render_per_client(formats_to_render, docx_fpath, release_model, render_workers,
+                                                   stats_by_format)
+        if client_files is None:
+            logger.error("--- Ошибки при создании отчета. ---"); sys.exit(1)
+        written_files.update(client_files)
+        formats_to_render = []
+
+    if split_into_volumes and 'docx' in formats_to_render:
+        volume_keys = renderers.split_grouped_data_into_volumes(
+            grouped_issues_data, volume_max_tasks, volume_max_size_kb * 1024 if volume_max_size_kb else None,
+            statistics=statistics_data)
+        if len(volume_keys) > 1:
+            stats_by_format['docx'] = {}
+            volume_files = renderers.render_docx_volumes(docx_fpath, release_model, volume_keys, render_workers,
+                                                         stats_by_format['docx'])
+            if volume_files is None:
+                logger.error("--- Ошибки при создании отчета. ---"); sys.exit(1)
+            for volume_name, output_filename in volume_files.items():
+                written_files[f"docx: {volume_name}"] = output_filename
+            formats_to_render = [f for f in formats_to_render if f != 'docx']
+        else:
+            logger.info("Релиз помещается в один том - DOCX создается без разбиения.")
+
+    if formats_to_render:
+        rendered_files = renderers.render_all_formats(formats_to_render, docx_fpath, release_model, stats_by_format)
+        written_files = None if rendered_files is None else {**written_files, **rendered_files}
+
+    if written_files is not None:
+        # Итог по DOCX, иначе по первому формату со счетчиками; JSON без дедупликации - в последнюю очередь
+        summary_formats = sorted(stats_by_format, key=lambda f: (f != 'docx', f == 'json'))
+        _log_run_summary(logger, next((stats_by_format[f] for f in summary_formats
+                                       if stats_by_format[f].get('task_occurrences')), {}))
+        for format_name, output_filename in written_files.items():
+            logger.info(f"--- Генерация отчета ({format_name}) успешно завершена: {os.path.abspath(output_filename)} ---")
     else:
-        logger.error("--- Ошибки при создании DOCX. ---"); sys.exit(1)
+        logger.error("--- Ошибки при создании отчета. ---"); sys.exit(1)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,214 @@
+# release_notes_generator/pipeline.py
+import csv
+import logging
+import queue
+import threading
+import time
+
+import csv_importer
+import docx_creator
+
+logger = logging.getLogger(__name__)
+
+_END_OF_STREAM = object()  # Маркер конца данных в очереди между стадиями
+
+
+def _new_stage_stats(stage_name):
+    return {'name': stage_name, 'items': 0, 'wait_seconds': 0.0, 'started': None, 'finished': None}
+
+
+def _put(stage_queue, item, stop_event, stage_stats):
+    """Кладет элемент в ограниченную очередь; ожидание свободного места (backpressure) учитывается как простой."""
+    wait_started = time.perf_counter()
+    while not stop_event.is_set():
+        try:
+            stage_queue.put(item, timeout=0.1)
+            break
+        except queue.Full:
+            continue
+    stage_stats['wait_seconds'] += time.perf_counter() - wait_started
+
+
+def _get(stage_queue, stop_event, stage_stats):
+    """Берет элемент из очереди; при остановке конвейера возвращает маркер конца данных."""
+    wait_started = time.perf_counter()
+    item = _END_OF_STREAM
+    while not stop_event.is_set():
+        try:
+            item = stage_queue.get(timeout=0.1)
+            break
+        except queue.Empty:
+            continue
+    stage_stats['wait_seconds'] += time.perf_counter() - wait_started
+    return item
+
+
+def _run_stage(stage_func, stage_stats, stop_event, errors):
+    stage_stats['started'] = time.perf_counter()
+    try:
+        stage_func()
+    except Exception as e:
+        logger.error(f"Ошибка на стадии '{stage_stats['name']}': {e}", exc_info=True)
+        errors.append(e)
+        stop_event.set()  # Останавливаем остальные стадии, чтобы они не ждали очередь вечно
+    finally:
+        stage_stats['finished'] = time.perf_counter()
+
+
+def _log_stage_utilisation(all_stage_stats, wall_seconds):
+    for stage_stats in all_stage_stats:
+        stage_seconds = (stage_stats['finished'] or 0.0) - (stage_stats['started'] or 0.0)
+        busy_seconds = max(stage_seconds - stage_stats['wait_seconds'], 0.0)
+        utilisation = busy_seconds / wall_seconds * 100 if wall_seconds else 0.0
+        logger.info(f"Стадия '{stage_stats['name']}': элементов {stage_stats['items']}, работа {busy_seconds:.3f} с, "
+                    f"ожидание очередей {stage_stats['wait_seconds']:.3f} с, загрузка {utilisation:.0f}%")
+
+
+def _open_csv(csv_filepath):
+    """Открывает CSV и читает заголовок; ошибки обрабатываются так же, как в load_and_process_issues.
+
+    Возвращает (файл, csv.reader, заголовок) либо None.
+    """
+    csvfile = None
+    try:
+        csvfile = open(csv_filepath, mode='r', encoding='utf-8-sig')
+        reader = csv.reader(csvfile, delimiter=',')
+        return csvfile, reader, next(reader)
+    except FileNotFoundError:
+        logger.error(f"Ошибка: CSV файл '{csv_filepath}' не найден.")
+    except StopIteration:
+        logger.error(f"Ошибка: CSV файл '{csv_filepath}' пуст или содержит только строку заголовков.")
+    except Exception as e:
+        logger.error(f"Ошибка при чтении CSV файла '{csv_filepath}': {e}", exc_info=True)
+    if csvfile is not None:
+        csvfile.close()
+    return None
+
+
+def run_pipelined_docx(csv_filepath, col_config, main_config, style_config, output_filename, build_title,
+                       dedupe_shared_tasks=False, collect_statistics=False, generated_at=None,
+                       reproducible=False, batch_size=500, queue_size=4, render_stats=None):
+    """Строит DOCX конвейером из трех потоков, связанных ограниченными очередями.
+
+    Чтение CSV -> (порции строк) -> разбор и группировка -> (готовые разделы версий) -> рендер DOCX.
+    Раздел версии уходит в рендер, как только groupby завершил его после общей сортировки;
+    шапка документа (заголовок, сводная таблица) выводится, пока группируются следующие версии.
+    Возвращает (заголовок, сгруппированные задачи, фактические уровни группировки, статистика или None)
+    либо None при ошибке.
+    """
+    opened_csv = _open_csv(csv_filepath)
+    if opened_csv is None:
+        return None
+    csvfile, reader, header = opened_csv
+    with csvfile:
+        resolved_columns = csv_importer.resolve_columns(header, col_config)
+        if resolved_columns is None:
+            return None
+        header_map, fix_versions_col_indices, issue_type_col_index, client_contract_col_index, \
+            group_col_indices = resolved_columns
+        row_filter = csv_importer.make_row_filter(col_config, fix_versions_col_indices, client_contract_col_index)
+        grouping_state = csv_importer.new_grouping_state(header_map, col_config, issue_type_col_index,
+                                                         client_contract_col_index, main_config,
+                                                         collect_statistics=collect_statistics,
+                                                         group_col_indices=group_col_indices)
+        if grouping_state is None:
+            return None
+
+        rows_queue = queue.Queue(maxsize=queue_size)
+        sections_queue = queue.Queue(maxsize=queue_size)
+        stop_event = threading.Event()
+        errors = []
+        reader_stats = _new_stage_stats("чтение CSV")
+        grouping_stats = _new_stage_stats("разбор и группировка")
+        render_stage_stats = _new_stage_stats("рендер DOCX")
+        result = {}
+
+        def read_stage():
+            batch = []
+            first_row_index = 0
+            for row in reader:
+                if stop_event.is_set():
+                    return
+                batch.append(row)
+                if len(batch) >= batch_size:
+                    reader_stats['items'] += len(batch)
+                    _put(rows_queue, (first_row_index, batch), stop_event, reader_stats)
+                    first_row_index += len(batch)
+                    batch = []
+            if batch:
+                reader_stats['items'] += len(batch)
+                _put(rows_queue, (first_row_index, batch), stop_event, reader_stats)
+            _put(rows_queue, _END_OF_STREAM, stop_event, reader_stats)
+
+        def grouping_stage():
+            while True:
+                item = _get(rows_queue, stop_event, grouping_stats)
+                if item is _END_OF_STREAM:
+                    break
+                first_row_index, raw_rows = item
+                rows = csv_importer.sanitize_rows(raw_rows, len(header), first_row_index, row_filter)
+                csv_importer.add_rows_to_grouping(grouping_state, rows, fix_versions_col_indices)
+                grouping_stats['items'] += len(rows)
+            if stop_event.is_set():
+                return
+            csv_importer.log_fix_version_cache_stats()
+
+            title = build_title(csv_importer.get_global_version_title(grouping_state))
+            version_keys = csv_importer.get_grouped_version_keys(grouping_state)
+            summary = docx_creator.extract_microservice_info_for_summary_table(version_keys, main_config) \
+                if version_keys else []
+            _put(sections_queue, ('header', title, summary, bool(version_keys), grouping_state['level_names']),
+                 stop_event, grouping_stats)
+            for section in csv_importer.iter_grouped_versions(grouping_state):
+                _put(sections_queue, ('section',) + section, stop_event, grouping_stats)
+            _put(sections_queue, _END_OF_STREAM, stop_event, grouping_stats)
+
+        def render_stage():
+            document = None
+            render_state = docx_creator.new_render_state(dedupe_shared_tasks)
+            grouped_data = {}
+            statistics = {} if collect_statistics else None
+            while True:
+                item = _get(sections_queue, stop_event, render_stage_stats)
+                if item is _END_OF_STREAM:
+                    break
+                if item[0] == 'header':
+                    _, title, summary, has_tasks, grouping_levels = item
+                    logger.info(f"Создание DOCX: {output_filename}")
+                    document = docx_creator.begin_release_notes_document(title, has_tasks, summary, main_config,
+                                                                         style_config, generated_at)
+                    result['title'] = title
+                    result['grouping_levels'] = grouping_levels
+                    continue
+                _, ms_version_key, version_subtree, statistics_rows = item
+                docx_creator.add_version_section(document, len(grouped_data), ms_version_key, version_subtree,
+                                                 result['grouping_levels'], render_state, main_config,
+                                                 style_config, statistics_rows=statistics_rows)
+                grouped_data[ms_version_key] = version_subtree
+                if statistics is not None:
+                    statistics[ms_version_key] = statistics_rows
+                render_stage_stats['items'] += 1
+            if stop_event.is_set() or document is None:
+                return
+            if not docx_creator.finish_release_notes_document(document, output_filename, render_state, render_stats,
+                                                              generated_at if reproducible else None):
+                raise IOError(f"DOCX '{output_filename}' не сохранен")
+            result['grouped_data'] = grouped_data
+            result['statistics'] = statistics
+
+        wall_started = time.perf_counter()
+        threads = [threading.Thread(target=_run_stage, args=(stage_func, stage_stats, stop_event, errors),
+                                    name=f"pipeline-{stage_func.__name__}", daemon=True)
+                   for stage_func, stage_stats in ((read_stage, reader_stats), (grouping_stage, grouping_stats),
+                                                   (render_stage, render_stage_stats))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        wall_seconds = time.perf_counter() - wall_started
+
+    _log_stage_utilisation((reader_stats, grouping_stats, render_stage_stats), wall_seconds)
+    if errors or 'grouped_data' not in result:
+        return None
+    logger.info(f"Конвейер завершен за {wall_seconds:.3f} с.")
+    return result['title'], result['grouped_data'], result['grouping_levels'], result['statistics']
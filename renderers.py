@@ -0,0 +1,486 @@
+# release_notes_generator/renderers.py
+import html
+import json
+import logging
+import os
+from collections.abc import Mapping
+import re
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime
+from types import MappingProxyType
+
+import docx_creator
+
+logger = logging.getLogger(__name__)
+
+# Реестр рендеров: имя формата -> (расширение файла, функция render(output_filename, model, render_stats))
+# Новый формат подключается декоратором register_renderer, без изменений в docx_creator.
+RENDERERS = {}
+
+
+def register_renderer(format_name, extension):
+    def decorator(render_func):
+        RENDERERS[format_name] = (extension, render_func)
+        return render_func
+
+    return decorator
+
+
+def freeze_grouped_data(grouped_data):
+    """Превращает сгруппированные задачи в неизменяемую структуру, общую для всех рендеров."""
+    if isinstance(grouped_data, Mapping):
+        return MappingProxyType({k: freeze_grouped_data(v) for k, v in grouped_data.items()})
+    if isinstance(grouped_data, (list, tuple)):
+        return tuple(freeze_grouped_data(item) for item in grouped_data)
+    return grouped_data
+
+
+def _to_plain(data):
+    if isinstance(data, Mapping):
+        return {k: _to_plain(v) for k, v in data.items()}
+    if isinstance(data, (list, tuple)):
+        return [_to_plain(item) for item in data]
+    return data
+
+
+def _iter_sections(model):
+    """Обходит модель в порядке группировки:
+    (уровень вложенности, заголовок группы или None, задачи или None, строки статистики версии или None).
+    Строки статистики отдаются только вместе с заголовком версии (уровень 0).
+    """
+
+    def walk(node, depth):
+        if isinstance(node, Mapping):
+            for group_name, child_node in node.items():
+                yield depth, group_name, None, None
+                yield from walk(child_node, depth + 1)
+        else:
+            yield depth, None, node, None
+
+    statistics = model.get('statistics') or {}
+    for ms_version_key in model['grouped_data']:
+        yield 0, docx_creator.get_ms_version_display_name(ms_version_key, model['main_config']), None, \
+            statistics.get(ms_version_key)
+        yield from walk(model['grouped_data'][ms_version_key], 1)
+
+
+def _task_anchor(task_key):
+    return docx_creator.task_bookmark_name(task_key)
+
+
+def _generation_date(model):
+    return (model.get('generated_at') or datetime.now()).strftime('%Y-%m-%d %H:%M')
+
+
+@register_renderer('docx', '.docx')
+def render_docx(output_filename, model, render_stats):
+    return docx_creator.create_release_notes_docx(
+        output_filename, model['title'], model['grouped_data'], model['grouping_levels'],
+        microservices_summary_data=model['microservices_summary_data'],
+        main_config=model['main_config'], style_config=model['style_config'],
+        dedupe_shared_tasks=model['dedupe_shared_tasks'], render_stats=render_stats,
+        generated_at=model.get('generated_at'), statistics_data=model.get('statistics'),
+        reproducible=model.get('reproducible', False)
+    )
+
+
+@register_renderer('md', '.md')
+def render_markdown(output_filename, model, render_stats):
+    lines = [f"# {model['title']}", "", f"*Дата генерации: {_generation_date(model)}*", ""]
+    if model['microservices_summary_data']:
+        lines += ["## Состав релиза по микросервисам", "", "| Микросервис | Версия |", "|---|---|"]
+        lines += [f"| {item.get('service_name', 'N/A')} | {item.get('version_number', 'N/A')} |"
+                  for item in model['microservices_summary_data']]
+        lines.append("")
+
+    rendered_tasks = {}
+    section_title = ""
+    for depth, group_name, tasks, statistics_rows in _iter_sections(model):
+        if group_name is not None:
+            if depth == 0:
+                section_title = group_name
+            lines += [f"{'#' * min(depth + 2, 6)} {group_name}", ""]
+            if statistics_rows:
+                lines += ["**Статистика задач:**", "", f"| {' | '.join(docx_creator.STATISTICS_TABLE_HEADER)} |",
+                          "|---|---|---|"]
+                lines += [f"| {' | '.join(row)} |" for row in docx_creator.statistics_table_rows(statistics_rows)]
+                lines.append("")
+            continue
+        for task in tasks:
+            render_stats['task_occurrences'] = render_stats.get('task_occurrences', 0) + 1
+            if model['dedupe_shared_tasks'] and task['key'] in rendered_tasks:
+                lines += [f"**{task['key']}:** [см. описание в разделе «{rendered_tasks[task['key']]}»]"
+                          f"(#{_task_anchor(task['key'])})", ""]
+                continue
+            render_stats['full_task_blocks'] = render_stats.get('full_task_blocks', 0) + 1
+            rendered_tasks[task['key']] = section_title
+            lines += [f"<a id=\"{_task_anchor(task['key'])}\"></a>**{task['key']}:**", "",
+                      task['cust_desc'] or "*Описание ... отсутствует.*", ""]
+            if task['install_instr']:
+                lines += ["**Инструкция:**", "", task['install_instr'], ""]
+
+    with open(output_filename, 'w', encoding='utf-8') as f:
+        f.write("\n".join(lines))
+    logger.info(f"Markdown '{output_filename}' успешно сохранен.")
+    return True
+
+
+@register_renderer('html', '.html')
+def render_html(output_filename, model, render_stats):
+    esc = html.escape
+    parts = ["<!DOCTYPE html>", "<html lang=\"ru\">", "<head>", "<meta charset=\"utf-8\">",
+             f"<title>{esc(model['title'])}</title>", "</head>", "<body>",
+             f"<h1>{esc(model['title'])}</h1>", f"<p><em>Дата генерации: {_generation_date(model)}</em></p>"]
+    if model['microservices_summary_data']:
+        parts += ["<h2>Состав релиза по микросервисам:</h2>", "<table border=\"1\">",
+                  "<tr><th>Микросервис</th><th>Версия</th></tr>"]
+        parts += [f"<tr><td>{esc(item.get('service_name', 'N/A'))}</td>"
+                  f"<td>{esc(item.get('version_number', 'N/A'))}</td></tr>"
+                  for item in model['microservices_summary_data']]
+        parts.append("</table>")
+
+    rendered_tasks = {}
+    section_title = ""
+    for depth, group_name, tasks, statistics_rows in _iter_sections(model):
+        if group_name is not None:
+            if depth == 0:
+                section_title = group_name
+            parts.append(f"<h{min(depth + 2, 6)}>{esc(group_name)}</h{min(depth + 2, 6)}>")
+            if statistics_rows:
+                parts += ["<p><strong>Статистика задач:</strong></p>", "<table border=\"1\">",
+                          "<tr>" + "".join(f"<th>{esc(cell)}</th>" for cell in docx_creator.STATISTICS_TABLE_HEADER)
+                          + "</tr>"]
+                parts += ["<tr>" + "".join(f"<td>{esc(cell)}</td>" for cell in row) + "</tr>"
+                          for row in docx_creator.statistics_table_rows(statistics_rows)]
+                parts.append("</table>")
+            continue
+        for task in tasks:
+            render_stats['task_occurrences'] = render_stats.get('task_occurrences', 0) + 1
+            anchor = _task_anchor(task['key'])
+            if model['dedupe_shared_tasks'] and task['key'] in rendered_tasks:
+                parts.append(f"<p><strong>{esc(task['key'])}:</strong> <a href=\"#{anchor}\">"
+                             f"см. описание в разделе «{esc(rendered_tasks[task['key']])}»</a></p>")
+                continue
+            render_stats['full_task_blocks'] = render_stats.get('full_task_blocks', 0) + 1
+            rendered_tasks[task['key']] = section_title
+            parts.append(f"<p id=\"{anchor}\"><strong>{esc(task['key'])}:</strong></p>")
+            parts.append(f"<p>{esc(task['cust_desc'])}</p>" if task['cust_desc']
+                         else "<p><em>Описание ... отсутствует.</em></p>")
+            if task['install_instr']:
+                parts.append(f"<p><strong>Инструкция:</strong></p><p>{esc(task['install_instr'])}</p>")
+    parts += ["</body>", "</html>"]
+
+    with open(output_filename, 'w', encoding='utf-8') as f:
+        f.write("\n".join(parts))
+    logger.info(f"HTML '{output_filename}' успешно сохранен.")
+    return True
+
+
+@register_renderer('json', '.json')
+def render_json(output_filename, model, render_stats):
+    versions = []
+    for ms_version_key in model['grouped_data']:
+        versions.append({
+            'key': ms_version_key,
+            'display_name': docx_creator.get_ms_version_display_name(ms_version_key, model['main_config']),
+            'tasks': _to_plain(model['grouped_data'][ms_version_key]),
+            'statistics': _to_plain((model.get('statistics') or {}).get(ms_version_key, []))
+        })
+    payload = {
+        'title': model['title'],
+        'generated_at': _generation_date(model),
+        'grouping_levels': list(model['grouping_levels']),
+        'microservices': _to_plain(model['microservices_summary_data']),
+        'versions': versions
+    }
+    # В JSON каждая задача выводится полностью в каждой своей версии (без ссылок дедупликации)
+    task_occurrences = sum(1 for _ in _iter_tasks(model['grouped_data']))
+    render_stats['task_occurrences'] = task_occurrences
+    render_stats['full_task_blocks'] = task_occurrences
+    with open(output_filename, 'w', encoding='utf-8') as f:
+        json.dump(payload, f, ensure_ascii=False, indent=2)
+    logger.info(f"JSON '{output_filename}' успешно сохранен.")
+    return True
+
+
+def get_output_filename(base_output_filename, format_name):
+    extension = RENDERERS[format_name][0]
+    return os.path.splitext(base_output_filename)[0] + extension
+
+
+def render_all_formats(formats, base_output_filename, model, stats_by_format=None):
+    """Параллельно запускает рендеры всех запрошенных форматов на одной неизменяемой модели.
+
+    Возвращает словарь формат -> путь к файлу для успешно созданных файлов, либо None при любой ошибке.
+    """
+    unknown_formats = [f for f in formats if f not in RENDERERS]
+    if unknown_formats:
+        logger.error(f"Неизвестные форматы вывода: {unknown_formats}. Доступны: {sorted(RENDERERS)}")
+        return None
+
+    frozen_model = MappingProxyType({**model,
+                                     'grouped_data': freeze_grouped_data(model['grouped_data']),
+                                     'grouping_levels': tuple(model.get('grouping_levels') or ()),
+                                     'statistics': freeze_grouped_data(model.get('statistics') or {}),
+                                     'microservices_summary_data': freeze_grouped_data(
+                                         model.get('microservices_summary_data') or [])})
+    if stats_by_format is None:
+        stats_by_format = {}
+    futures = {}
+    with ThreadPoolExecutor(max_workers=len(formats) or 1) as executor:
+        for format_name in formats:
+            output_filename = get_output_filename(base_output_filename, format_name)
+            stats_by_format[format_name] = {}
+            logger.info(f"Запуск рендера '{format_name}': {output_filename}")
+            futures[format_name] = (output_filename, executor.submit(
+                RENDERERS[format_name][1], output_filename, frozen_model, stats_by_format[format_name]))
+
+    written_files = {}
+    all_ok = True
+    for format_name, (output_filename, future) in futures.items():
+        try:
+            if future.result():
+                written_files[format_name] = output_filename
+            else:
+                all_ok = False
+        except Exception as e:
+            logger.error(f"Ошибка рендера '{format_name}' ({output_filename}): {e}", exc_info=True)
+            all_ok = False
+    return written_files if all_ok else None
+
+
+def _iter_tasks(node):
+    if isinstance(node, Mapping):
+        for child_node in node.values():
+            yield from _iter_tasks(child_node)
+    else:
+        yield from node
+
+
+def _filter_tree(node, task_predicate):
+    """Копия дерева групп только с подходящими задачами; опустевшие группы отбрасываются."""
+    if isinstance(node, Mapping):
+        filtered = {}
+        for group_name, child_node in node.items():
+            filtered_child = _filter_tree(child_node, task_predicate)
+            if filtered_child:
+                filtered[group_name] = filtered_child
+        return filtered
+    return [task for task in node if task_predicate(task)]
+
+
+def split_grouped_data_by_client(grouped_data, statistics=None):
+    """Разбивает сгруппированные задачи по клиентам: клиент -> (поддерево задач, статистика или None)."""
+    clients = {task.get('client') for task in _iter_tasks(grouped_data)}
+    if None in clients:
+        logger.error("Для задач не определен клиент: колонка клиента не найдена в CSV.")
+        return None
+
+    split_data = {}
+    for client_name in sorted(clients):
+        client_grouped_data = _filter_tree(grouped_data, lambda task: task['client'] == client_name)
+        client_statistics = None
+        if statistics is not None:
+            client_statistics = {ms_version_key: [row for row in rows if row['client'] == client_name]
+                                 for ms_version_key, rows in statistics.items() if ms_version_key in client_grouped_data}
+        split_data[client_name] = (client_grouped_data, client_statistics)
+    return split_data
+
+
+def _render_docx_job(job):
+    """Рендер одного DOCX в процессе пула; render_stats возвращаются явно, т.к. процесс отдельный."""
+    render_stats = {}
+    success = docx_creator.create_release_notes_docx(**job, render_stats=render_stats)
+    return success, render_stats
+
+
+def render_docx_jobs_parallel(jobs, max_workers=None):
+    """Рендерит несколько DOCX в пуле процессов (python-docx упирается в GIL, поэтому не потоки).
+
+    jobs - список именованных аргументов create_release_notes_docx.
+    Возвращает суммарные render_stats, либо None, если хотя бы один документ не создан.
+    """
+    total_stats = {'task_occurrences': 0, 'full_task_blocks': 0}
+    all_ok = True
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = [(job['output_filename'], executor.submit(_render_docx_job, job)) for job in jobs]
+        for output_filename, future in futures:
+            try:
+                success, render_stats = future.result()
+            except Exception as e:
+                logger.error(f"Ошибка рендера DOCX '{output_filename}': {e}", exc_info=True)
+                success, render_stats = False, {}
+            all_ok = all_ok and success
+            for stat_key in total_stats:
+                total_stats[stat_key] += render_stats.get(stat_key, 0)
+    return total_stats if all_ok else None
+
+
+def _docx_job(model, output_filename, title, grouped_data, statistics):
+    """Аргументы create_release_notes_docx для части релиза (клиента или тома) на основе общей модели."""
+    return {
+        'output_filename': output_filename,
+        'title': title,
+        'grouped_data': grouped_data,
+        'grouping_levels': model['grouping_levels'],
+        'microservices_summary_data': docx_creator.extract_microservice_info_for_summary_table(
+            grouped_data.keys(), model['main_config']),
+        'main_config': model['main_config'],
+        'style_config': model['style_config'],
+        'dedupe_shared_tasks': model['dedupe_shared_tasks'],
+        'generated_at': model.get('generated_at'),
+        'statistics_data': statistics,
+        'reproducible': model.get('reproducible', False)
+    }
+
+
+def _client_file_suffix(client_name):
+    return re.sub(r"[^\w\-]+", "_", client_name).strip("_") or "client"
+
+
+def render_per_client(formats, base_output_filename, model, max_workers=None, stats_by_format=None):
+    """Отдельные файлы каждого запрошенного формата для каждого клиента: свои задачи, сводная таблица и статистика.
+
+    Ни один файл не содержит задач других клиентов. DOCX рендерятся в пуле процессов,
+    остальные форматы - render_all_formats на модели клиента.
+    Возвращает словарь 'формат: клиент' -> путь к файлу, либо None при ошибке.
+    """
+    unknown_formats = [f for f in formats if f not in RENDERERS]
+    if unknown_formats:
+        logger.error(f"Неизвестные форматы вывода: {unknown_formats}. Доступны: {sorted(RENDERERS)}")
+        return None
+    split_data = split_grouped_data_by_client(model['grouped_data'], model.get('statistics'))
+    if split_data is None:
+        return None
+    if stats_by_format is None:
+        stats_by_format = {}
+    base_name, extension = os.path.splitext(base_output_filename)
+    other_formats = [f for f in formats if f != 'docx']
+    written_files = {}
+    used_suffixes = set()
+    jobs = []
+    for client_name, (client_grouped_data, client_statistics) in split_data.items():
+        file_suffix = _client_file_suffix(client_name)
+        while file_suffix in used_suffixes:  # Разные имена клиентов могут дать одинаковый суффикс
+            file_suffix += "_"
+        used_suffixes.add(file_suffix)
+        client_base_filename = f"{base_name}_{file_suffix}{extension or '.docx'}"
+        client_title = f"{model['title']} — {client_name}"
+        if 'docx' in formats:
+            written_files[f"docx: {client_name}"] = client_base_filename
+            jobs.append(_docx_job(model, client_base_filename, client_title, client_grouped_data, client_statistics))
+        if other_formats:
+            client_model = {**model,
+                            'title': client_title,
+                            'grouped_data': client_grouped_data,
+                            'statistics': client_statistics,
+                            'microservices_summary_data': docx_creator.extract_microservice_info_for_summary_table(
+                                client_grouped_data.keys(), model['main_config'])}
+            client_stats = {}
+            client_files = render_all_formats(other_formats, client_base_filename, client_model, client_stats)
+            if client_files is None:
+                return None
+            for format_name, output_filename in client_files.items():
+                written_files[f"{format_name}: {client_name}"] = output_filename
+                format_stats = stats_by_format.setdefault(format_name, {'task_occurrences': 0, 'full_task_blocks': 0})
+                for stat_key in ('task_occurrences', 'full_task_blocks'):
+                    format_stats[stat_key] = format_stats.get(stat_key, 0) + client_stats[format_name].get(stat_key, 0)
+
+    if jobs:
+        logger.info(f"Рендер {len(jobs)} клиентских DOCX в пуле процессов "
+                    f"(процессов: {max_workers or 'по числу CPU'})...")
+        total_stats = render_docx_jobs_parallel(jobs, max_workers)
+        if total_stats is None:
+            return None
+        stats_by_format['docx'] = total_stats
+    return written_files
+
+
+# Примерный объем несжатого XML (word/document.xml), который дают элементы документа;
+# откалиброван по выводу create_release_notes_docx со стилями из styles.ini
+DOCUMENT_HEADER_XML_BYTES = 3400  # Заголовок, дата, заголовок и шапка сводной таблицы
+VERSION_XML_BYTES = 1150  # Заголовок раздела версии и ее строка в сводной таблице
+GROUP_HEADER_XML_BYTES = 370  # Заголовок группы (клиент, тип задачи, ...)
+TASK_BLOCK_XML_BYTES = 660  # Блок задачи без учета текста
+INSTALL_INSTR_XML_BYTES = 680  # Дополнительные абзацы инструкции по установке
+STATISTICS_TABLE_XML_BYTES = 3300  # Заголовок, шапка и строка "Итого" таблицы статистики
+STATISTICS_ROW_XML_BYTES = 770
+
+
+def _estimate_tree_xml_size(node):
+    if isinstance(node, Mapping):
+        return sum(GROUP_HEADER_XML_BYTES + _estimate_tree_xml_size(child_node) for child_node in node.values())
+    return sum(TASK_BLOCK_XML_BYTES + (INSTALL_INSTR_XML_BYTES if task.get('install_instr') else 0) +
+               sum(len(task.get(field, "").encode('utf-8')) for field in ('key', 'cust_desc', 'install_instr'))
+               for task in node)
+
+
+def _estimate_version_xml_size(version_subtree, statistics_rows=None):
+    """Примерный вклад раздела версии в объем несжатого word/document.xml."""
+    size = VERSION_XML_BYTES + _estimate_tree_xml_size(version_subtree)
+    if statistics_rows:
+        size += STATISTICS_TABLE_XML_BYTES + STATISTICS_ROW_XML_BYTES * len(statistics_rows)
+    return size
+
+
+def split_grouped_data_into_volumes(grouped_data, max_tasks=None, max_size_bytes=None, statistics=None):
+    """Делит версии микросервисов по томам, не разрывая версию: том закрывается, когда следующая
+    версия превысила бы max_tasks задач или max_size_bytes примерного объема несжатого XML документа
+    (word/document.xml, включая шапку, заголовки групп и таблицы статистики; сам .docx сжат и заметно меньше).
+
+    Версия, которая одна больше лимита, занимает отдельный том. Возвращает список списков ключей версий.
+    """
+    volumes = []
+    current_keys, current_tasks, current_size = [], 0, DOCUMENT_HEADER_XML_BYTES
+    for ms_version_key, version_subtree in grouped_data.items():
+        version_tasks_count = sum(1 for _ in _iter_tasks(version_subtree))
+        version_size = _estimate_version_xml_size(version_subtree, (statistics or {}).get(ms_version_key))
+        exceeds_limit = (max_tasks and current_tasks + version_tasks_count > max_tasks) or \
+                        (max_size_bytes and current_size + version_size > max_size_bytes)
+        if current_keys and exceeds_limit:
+            volumes.append(current_keys)
+            current_keys, current_tasks, current_size = [], 0, DOCUMENT_HEADER_XML_BYTES
+        current_keys.append(ms_version_key)
+        current_tasks += version_tasks_count
+        current_size += version_size
+    if current_keys:
+        volumes.append(current_keys)
+    return volumes
+
+
+def render_docx_volumes(base_output_filename, model, volume_keys, max_workers=None, render_stats=None):
+    """Рендерит тома (base_vol1.docx, ...) в пуле процессов и главный документ base.docx со списком томов.
+
+    volume_keys - результат split_grouped_data_into_volumes.
+    Возвращает словарь название -> путь к файлу, либо None при ошибке.
+    """
+    base_name, extension = os.path.splitext(base_output_filename)
+    extension = extension or '.docx'
+    statistics = model.get('statistics')
+    volume_files = {}
+    volumes_index = []
+    jobs = []
+    for volume_idx, ms_version_keys in enumerate(volume_keys, start=1):
+        output_filename = f"{base_name}_vol{volume_idx}{extension}"
+        volume_grouped_data = {ms_version_key: model['grouped_data'][ms_version_key] for ms_version_key in ms_version_keys}
+        volume_statistics = {ms_version_key: statistics[ms_version_key] for ms_version_key in ms_version_keys} \
+            if statistics is not None else None
+        job = _docx_job(model, output_filename, f"{model['title']} — том {volume_idx} из {len(volume_keys)}",
+                        volume_grouped_data, volume_statistics)
+        jobs.append(job)
+        volume_files[f"том {volume_idx}"] = output_filename
+        volumes_index.append({'file_name': os.path.basename(output_filename),
+                              'task_count': sum(1 for _ in _iter_tasks(volume_grouped_data)),
+                              'microservices_summary_data': job['microservices_summary_data']})
+
+    logger.info(f"Рендер {len(jobs)} томов DOCX в пуле процессов (процессов: {max_workers or 'по числу CPU'})...")
+    total_stats = render_docx_jobs_parallel(jobs, max_workers)
+    if total_stats is None:
+        return None
+    if not docx_creator.create_volume_index_docx(base_output_filename, model['title'], volumes_index,
+                                                 model['main_config'], model['style_config'],
+                                                 model.get('generated_at'), model.get('reproducible', False)):
+        return None
+    if render_stats is not None:
+        render_stats.update(total_stats)
+    return {'оглавление томов': base_output_filename, **volume_files}